@@ -0,0 +1,189 @@
+'''
+Asynchronous off-policy training (SAC / TD3): a collector thread keeps stepping the VecEnv workers into
+the replay buffer while the learner thread runs gradient steps, instead of SB3 alternating the two.
+
+The update-to-data (UTD) ratio, gradient steps per collected transition, is enforced both ways: the learner
+waits for data when it is ahead of the ratio, and the collector pauses when it runs more than `max_lead`
+transitions ahead of the updates. At the end of training the learner catches up, so a run performs exactly
+utd_ratio * (timesteps - learning_starts) gradient steps, as the synchronous loop would with the same ratio.
+
+The collector runs SB3's own collect_rollouts (callbacks, episode info, log dumps, action noise), with the
+replay buffer and the logger behind locks shared with the learner. It acts with its own copy of the policy
+(the actor keeps per-call distribution state), loading the learner's latest actor weights before each rollout.
+'''
+
+import copy
+import threading
+
+from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
+from stable_baselines3.common.type_aliases import TrainFrequencyUnit
+
+
+class SharedReplayBuffer:
+    '''
+    Replay buffer proxy serializing the collector's adds and the learner's samples.
+    '''
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.lock = threading.Lock()
+
+    def add(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.buffer.add(*args, **kwargs)
+
+    def sample(self, *args, **kwargs):
+        with self.lock:
+            return self.buffer.sample(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.buffer, name)
+
+
+class SharedLogger:
+    '''
+    Logger proxy serializing the records of the collector (callbacks, log dumps) and the learner (train/ values).
+    '''
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.lock = threading.Lock()
+
+    def record(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.logger.record(*args, **kwargs)
+
+    def record_mean(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.logger.record_mean(*args, **kwargs)
+
+    def dump(self, *args, **kwargs) -> None:
+        with self.lock:
+            self.logger.dump(*args, **kwargs)
+
+    @property
+    def name_to_value(self) -> dict:
+        with self.lock:
+            return dict(self.logger.name_to_value)
+
+    def __getattr__(self, name):
+        return getattr(self.logger, name)
+
+
+def default_utd_ratio(model) -> float:
+    '''
+    UTD ratio of SB3's synchronous loop: gradient_steps per train_freq steps of every env.
+    '''
+    if model.train_freq.unit != TrainFrequencyUnit.STEP:
+        raise ValueError("Asynchronous training needs a train_freq in steps, or an explicit utd_ratio")
+    if model.gradient_steps < 0:
+        return 1.0
+    return model.gradient_steps / (model.train_freq.frequency * model.n_envs)
+
+
+class AsyncOffPolicyLearner:
+    '''
+    :param model: SAC / TD3 model
+    :param utd_ratio: gradient steps per collected transition (None: the ratio of SB3's synchronous loop)
+    :param max_lead: transitions the collector may run ahead of the updates due
+    :param max_chunk: most gradient steps per model.train call (bounds the delay between logged updates)
+    '''
+
+    def __init__(self, model, utd_ratio: float | None = None, max_lead: int = 2000, max_chunk: int = 64):
+        if not isinstance(model, OffPolicyAlgorithm):
+            raise ValueError("Asynchronous collection is for off-policy algorithms (SAC, TD3)")
+        self.model = model
+        self.utd_ratio = utd_ratio if utd_ratio is not None else default_utd_ratio(model)
+        self.max_lead = max_lead
+        self.max_chunk = max_chunk
+        self.condition = threading.Condition()
+        self.updates = 0            # Gradient steps done in this learn() call
+        self.collected = 0          # Transitions collected past learning_starts in this learn() call
+        self.collecting = False
+        self.error = None
+        self.start_timesteps = 0
+        self.collector_policy = None
+        self.weights = None         # Latest actor weights published by the learner
+
+    def publish_weights(self) -> None:
+        self.weights = {key: value.detach().clone() for key, value in self.model.policy.actor.state_dict().items()}
+
+    def updates_due(self) -> int:
+        return int(self.utd_ratio * self.collected)
+
+    def collect(self, total_timesteps: int, callback, log_interval: int) -> None:
+        model = self.model
+        try:
+            while model.num_timesteps < total_timesteps:
+                with self.condition:
+                    self.condition.wait_for(
+                        lambda: self.updates_due() - self.updates <= self.utd_ratio * self.max_lead or not self.collecting
+                    )
+                    if not self.collecting:
+                        break
+                weights, self.weights = self.weights, None
+                if weights is not None:
+                    self.collector_policy.actor.load_state_dict(weights)
+                rollout = model.collect_rollouts(
+                    model.env,
+                    train_freq=model.train_freq,
+                    action_noise=model.action_noise,
+                    callback=callback,
+                    learning_starts=model.learning_starts,
+                    replay_buffer=model.replay_buffer,
+                    log_interval=log_interval,
+                )
+                with self.condition:
+                    self.collected = max(0, model.num_timesteps - max(model.learning_starts, self.start_timesteps))
+                    self.condition.notify_all()
+                if not rollout.continue_training:
+                    break
+        except BaseException as error:
+            self.error = error
+        finally:
+            with self.condition:
+                self.collecting = False
+                self.condition.notify_all()
+
+    def learn(self, total_timesteps: int, callback=None, log_interval: int = 4, tb_log_name: str = "run",
+              reset_num_timesteps: bool = True):
+        model = self.model
+        total_timesteps, _ = model._setup_learn(total_timesteps, None, reset_num_timesteps, tb_log_name)
+        logger, replay_buffer = model._logger, model.replay_buffer
+        model._logger = SharedLogger(logger)
+        model.replay_buffer = SharedReplayBuffer(replay_buffer)
+        callback = model._init_callback(callback)
+        callback.on_training_start(locals(), globals())
+        # collect_rollouts samples its actions through model.predict
+        self.collector_policy = copy.deepcopy(model.policy)
+        model.predict = self.collector_policy.predict
+
+        self.start_timesteps = model.num_timesteps
+        self.updates = self.collected = 0
+        self.collecting, self.error = True, None
+        collector = threading.Thread(target=self.collect, args=(total_timesteps, callback, log_interval), daemon=True)
+        collector.start()
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.updates_due() > self.updates or not self.collecting)
+                    gradient_steps = min(self.updates_due() - self.updates, self.max_chunk)
+                if gradient_steps <= 0:
+                    break           # Collection is over and the learner has caught up
+                model.train(gradient_steps=gradient_steps, batch_size=model.batch_size)
+                self.publish_weights()
+                with self.condition:
+                    self.updates += gradient_steps
+                    self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.collecting = False
+                self.condition.notify_all()
+            collector.join()
+            model._logger, model.replay_buffer = logger, replay_buffer
+            del model.predict
+        if self.error is not None:
+            raise self.error
+
+        callback.on_training_end()
+        return model
@@ -0,0 +1,171 @@
+'''
+Oversubscribed SubprocVecEnv that keeps episode resets off the critical path.
+
+RacetrackEnv episodes vary a lot in cost: a reset building the large track with 10-15 IDM vehicles is
+much slower than a small-track step, and SubprocVecEnv waits for the slowest worker on every step.
+AsyncVecEnv runs n_workers >= num_envs worker processes. Each VecEnv slot is bound to one worker for
+a whole episode, so every slot still yields a continuous trajectory (required by PPO's rollouts and
+the replay buffer of SAC/TD3). When a slot's episode ends, its worker resets in the background and the
+slot is rebound to the first spare worker whose reset is ready; the reset observation returned for the
+slot is that spare's.
+
+Which spare gets picked depends on timing, so rollouts are not reproducible across runs even with a seed.
+'''
+
+import multiprocessing as mp
+from multiprocessing.connection import wait
+from collections.abc import Callable
+from typing import Any
+
+import gymnasium as gym
+import numpy as np
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv, VecEnvIndices
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+from stable_baselines3.common.vec_env.subproc_vec_env import _stack_obs
+
+from env_worker import serve_env
+
+
+def _worker(remote, parent_remote, env_fn_wrapper: CloudpickleWrapper) -> None:
+    '''
+    SubprocVecEnv's worker, except that a finished episode is reported first and the env is reset
+    afterwards, with the reset observation sent as a separate message.
+    '''
+    parent_remote.close()
+    env = _patch_env(env_fn_wrapper.var())
+    try:
+        serve_env(remote, env, reset_after_send=True)
+    except KeyboardInterrupt:
+        pass
+    env.close()
+    remote.close()
+
+
+class AsyncVecEnv(SubprocVecEnv):
+    '''
+    :param env_fns: one env constructor per VecEnv slot
+    :param n_workers: worker processes (>= len(env_fns)), the extra ones are spares absorbing resets.
+           Defaults to 25% more workers than slots.
+    :param start_method: multiprocessing start method (see SubprocVecEnv)
+
+    get_attr / set_attr / env_method without indices address every worker, spares included.
+    '''
+
+    def __init__(self, env_fns: list[Callable[[], gym.Env]], n_workers: int | None = None, start_method: str | None = None):
+        n_envs = len(env_fns)
+        n_workers = n_workers or n_envs + max(1, n_envs // 4)
+        assert n_workers >= n_envs, "AsyncVecEnv needs at least one worker per slot"
+        self.waiting = False
+        self.closed = False
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        worker_fns = [env_fns[i % n_envs] for i in range(n_workers)]
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(self.work_remotes, self.remotes, worker_fns):
+            process = ctx.Process(target=_worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)), daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.n_workers = n_workers
+        self.slot_workers = list(range(n_envs))     # Worker bound to each slot
+        self.pending = set()                        # Workers resetting in the background
+        self.ready = {}                             # Spare worker -> (reset obs, reset info), oldest first
+        self.rebinds = 0
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+    def _collect_resets(self, block: bool) -> None:
+        '''
+        Receive the reset observations of the workers that finished resetting.
+        If block and no spare is ready, wait for the first one.
+        '''
+        if not self.pending:
+            return
+        remotes = {self.remotes[worker]: worker for worker in self.pending}
+        for remote in wait(list(remotes), timeout=None if block and not self.ready else 0):
+            worker = remotes[remote]
+            self.ready[worker] = remote.recv()
+            self.pending.remove(worker)
+
+    def _drain(self) -> None:
+        for worker in self.pending:
+            self.ready[worker] = self.remotes[worker].recv()
+        self.pending.clear()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        for worker, action in zip(self.slot_workers, actions):
+            self.remotes[worker].send(("step", action))
+        self.waiting = True
+
+    def step_wait(self):
+        results = [self.remotes[worker].recv() for worker in self.slot_workers]
+        self.waiting = False
+        obs, rews, dones, infos = zip(*results)
+        obs = list(obs)
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+
+        for slot, done in enumerate(dones):
+            if not done:
+                continue
+            # The finished worker resets in the background, the slot continues on the first ready spare
+            self.pending.add(self.slot_workers[slot])
+            self._collect_resets(block=True)
+            worker = next(iter(self.ready))
+            obs[slot], self.reset_infos[slot] = self.ready.pop(worker)
+            self.slot_workers[slot] = worker
+            self.rebinds += 1
+
+        return _stack_obs(obs, self.observation_space), np.stack(rews), np.stack(dones), infos
+
+    def reset(self):
+        self._drain()
+        # Spares get the seeds following the slots' seeds
+        seeds = list(self._seeds)
+        if seeds[0] is not None:
+            seeds += [seeds[0] + i for i in range(self.num_envs, self.n_workers)]
+        else:
+            seeds += [None] * (self.n_workers - self.num_envs)
+        options = list(self._options) + [{}] * (self.n_workers - self.num_envs)
+
+        for remote, seed, option in zip(self.remotes, seeds, options):
+            remote.send(("reset", (seed, option)))
+        results = [remote.recv() for remote in self.remotes]
+
+        self.slot_workers = list(range(self.num_envs))
+        self.ready = {worker: results[worker] for worker in range(self.num_envs, self.n_workers)}
+        obs, self.reset_infos = zip(*results[:self.num_envs])
+        self._reset_seeds()
+        self._reset_options()
+        return _stack_obs(obs, self.observation_space)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for worker in self.slot_workers:
+                self.remotes[worker].recv()
+            self.waiting = False
+        self._drain()
+        super().close()
+
+    def get_images(self):
+        if self.render_mode != "rgb_array":
+            return super().get_images()[:self.num_envs]
+        for worker in self.slot_workers:
+            self.remotes[worker].send(("render", None))
+        return [self.remotes[worker].recv() for worker in self.slot_workers]
+
+    def _get_target_remotes(self, indices: VecEnvIndices) -> list[Any]:
+        # Pending reset messages must be received before any other command
+        self._drain()
+        if indices is None:
+            return list(self.remotes)
+        return [self.remotes[self.slot_workers[i]] for i in self._get_indices(indices)]
@@ -0,0 +1,273 @@
+'''
+Environment throughput benchmark.
+Measures steps/sec and resets/sec of RacetrackEnv on both tracks across vehicle counts and
+observation configs, vectorized steps/sec in DummyVecEnv / SubprocVecEnv, and startup time
+(import of racetrack_env, SubprocVecEnv start + first reset with and without forkserver preloading).
+
+Results are written as JSON and compared against a stored baseline, so environment
+performance regressions show up before a multi-hour training run.
+
+Usage:
+    python benchmark_env.py                     # run, compare with benchmarks/env_baseline.json
+    python benchmark_env.py --quick             # fewer steps and cases, compare with benchmarks/env_baseline_quick.json
+    python benchmark_env.py --startup           # startup benchmarks only
+    python benchmark_env.py --update-baseline   # run and store the results as the new baseline
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+from racetrack_env import RacetrackEnv
+from async_vec_env import AsyncVecEnv
+from train_model import WORKER_PRELOAD
+
+current_folder = os.path.dirname(os.path.abspath(__file__))
+default_baseline = os.path.join(current_folder, "benchmarks", "env_baseline.json")
+# Quick runs use fewer steps and other vec sizes, so they have their own baseline
+quick_baseline = os.path.join(current_folder, "benchmarks", "env_baseline_quick.json")
+
+# Observation configs benchmarked (None = RacetrackEnv default)
+OBSERVATIONS = {
+    "occupancy_grid": None,
+    "occupancy_grid_coarse": {
+        "type": "OccupancyGrid",
+        "features": ["presence", "on_road"],
+        "grid_size": [[-20, 20], [-20, 20]],
+        "grid_step": [2, 2],
+        "as_image": False,
+        "align_to_vehicle_axes": True,
+    },
+    "cached_occupancy_grid": {
+        "type": "CachedOccupancyGrid",
+        "features": ["presence", "on_road"],
+        "grid_size": [[-20, 20], [-20, 20]],
+        "grid_step": [1, 1],
+        "as_image": False,
+        "align_to_vehicle_axes": True,
+    },
+    "compact": {
+        "type": "RacetrackCompact",
+        "vehicles_count": 4,
+        "lookahead": [0, 10, 20, 30, 40],
+    },
+}
+
+# Vehicle counts benchmarked on each track (in the ranges drawn by RacetrackEnv._reset)
+VEHICLE_COUNTS = {
+    "small": [1, 4],
+    "large": [10, 14],
+}
+
+# Rates compared against the baseline (higher is better)
+RATE_METRICS = ("steps_per_sec", "resets_per_sec")
+
+# Durations compared against the baseline (lower is better)
+TIME_METRICS = ("import_sec", "startup_sec")
+
+
+def make_config(track=None, other_vehicles=None, observation="occupancy_grid") -> dict:
+    config = {}
+    if track is not None:
+        config.update({"different_scenarios": False, "track": track, "other_vehicles": other_vehicles})
+    if OBSERVATIONS[observation] is not None:
+        config["observation"] = OBSERVATIONS[observation]
+    return config
+
+
+def make_env_fn(config: dict):
+    def _init():
+        return RacetrackEnv(config=config)
+    return _init
+
+
+def bench_single(config: dict, n_steps: int, n_resets: int, seed: int = 0) -> dict:
+    '''
+    Steps/sec (with auto-reset, fixed seeded actions) and resets/sec of a single env.
+    '''
+    env = make_env_fn(config)()
+    env.reset(seed=seed)
+    env.action_space.seed(seed)
+    actions = [env.action_space.sample() for _ in range(n_steps)]
+
+    step_times = np.empty(n_steps)
+    for i, action in enumerate(actions):
+        start = time.perf_counter()
+        _, _, terminated, truncated, _ = env.step(action)
+        step_times[i] = time.perf_counter() - start
+        if terminated or truncated:
+            env.reset()
+
+    start = time.perf_counter()
+    for _ in range(n_resets):
+        env.reset()
+    reset_time = time.perf_counter() - start
+    env.close()
+
+    return {
+        "steps_per_sec": n_steps / step_times.sum(),
+        "resets_per_sec": n_resets / reset_time,
+        "mean_step_ms": step_times.mean() * 1e3,
+        "p99_step_ms": np.percentile(step_times, 99) * 1e3,
+    }
+
+
+def bench_vec(vec_cls, n_envs: int, config: dict, n_steps: int, seed: int = 0) -> dict:
+    '''
+    Total env steps/sec of a vectorized env (auto-reset included).
+    '''
+    env = vec_cls([make_env_fn(config) for _ in range(n_envs)])
+    env.seed(seed)
+    env.reset()
+    rng = np.random.default_rng(seed)
+    actions = rng.uniform(-1, 1, size=(n_steps, n_envs) + env.action_space.shape).astype(np.float32)
+
+    start = time.perf_counter()
+    for action in actions:
+        env.step(action)
+    elapsed = time.perf_counter() - start
+    env.close()
+
+    return {
+        "steps_per_sec": n_steps * n_envs / elapsed,
+        "mean_step_ms": elapsed / n_steps * 1e3,
+    }
+
+
+def run_python(code: str) -> float:
+    '''
+    Run code in a fresh interpreter and return the float it prints.
+    '''
+    result = subprocess.run([sys.executable, "-c", code], cwd=current_folder, capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def bench_import(n_runs: int) -> dict:
+    '''
+    Median time to import racetrack_env in a fresh interpreter.
+    '''
+    code = "import time; start = time.perf_counter(); import racetrack_env; print(time.perf_counter() - start)"
+    return {"import_sec": float(np.median([run_python(code) for _ in range(n_runs)]))}
+
+
+def bench_startup(n_envs: int, preload: bool) -> dict:
+    '''
+    Time from a fresh interpreter to a SubprocVecEnv of n_envs workers after its first reset.
+    '''
+    code = "\n".join([
+        "import time, multiprocessing",
+        "start = time.perf_counter()",
+        f"multiprocessing.set_forkserver_preload({WORKER_PRELOAD!r})" if preload else "",
+        "from stable_baselines3.common.vec_env import SubprocVecEnv",
+        "from racetrack_env import RacetrackEnv",
+        f"env = SubprocVecEnv([RacetrackEnv] * {n_envs})",
+        "env.reset()",
+        "print(time.perf_counter() - start)",
+        "env.close()",
+    ])
+    return {"startup_sec": run_python(code)}
+
+
+def run_startup_benchmarks(quick: bool = False) -> dict:
+    print("Running startup/import...", file=sys.stderr)
+    results = {"startup/import": bench_import(3 if quick else 10)}
+    for n_envs in [4] if quick else [4, 8]:
+        for preload in (False, True):
+            name = f"startup/SubprocVecEnv/n_envs_{n_envs}/{'preload' if preload else 'no_preload'}"
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = bench_startup(n_envs, preload)
+    return results
+
+
+def run_benchmarks(quick: bool = False) -> dict:
+    n_steps = 50 if quick else 300
+    n_resets = 5 if quick else 30
+    observations = ["occupancy_grid"] if quick else list(OBSERVATIONS)
+    vec_sizes = [2] if quick else [1, 4, 8]
+
+    results = {}
+    for track, counts in VEHICLE_COUNTS.items():
+        for other_vehicles in counts:
+            for observation in observations:
+                name = f"single/{track}/vehicles_{other_vehicles}/{observation}"
+                print(f"Running {name}...", file=sys.stderr)
+                results[name] = bench_single(make_config(track, other_vehicles, observation), n_steps, n_resets)
+
+    # Vectorized runs use the training configuration (different scenarios on every reset)
+    for vec_cls in (DummyVecEnv, SubprocVecEnv, AsyncVecEnv):
+        for n_envs in vec_sizes:
+            name = f"vec/{vec_cls.__name__}/n_envs_{n_envs}"
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = bench_vec(vec_cls, n_envs, make_config(), n_steps)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    '''
+    Return a description of every rate that dropped more than `tolerance` below the baseline.
+    '''
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            print(f"{'MISSING':>10}  {name}: no baseline entry, not compared", file=sys.stderr)
+            continue
+        for key in RATE_METRICS + TIME_METRICS:
+            if key not in metrics or key not in baseline[name]:
+                continue
+            ratio = metrics[key] / baseline[name][key]
+            if key in TIME_METRICS:
+                ratio = 1 / ratio       # Speedup
+            status = "REGRESSION" if ratio < 1 - tolerance else "ok"
+            print(f"{status:>10}  {name} {key}: {metrics[key]:.1f} vs {baseline[name][key]:.1f} ({ratio:.2f}x)", file=sys.stderr)
+            if status != "ok":
+                regressions.append(f"{name} {key} {ratio:.2f}x")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RacetrackEnv throughput benchmark")
+    parser.add_argument("--quick", action="store_true", help="fewer steps and cases")
+    parser.add_argument("--output", help="write the JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="baseline JSON file (default: benchmarks/env_baseline.json, "
+                                           "benchmarks/env_baseline_quick.json with --quick)")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    parser.add_argument("--startup", action="store_true", help="only run the startup benchmarks")
+    args = parser.parse_args()
+    if args.baseline is None:
+        args.baseline = quick_baseline if args.quick else default_baseline
+
+    results = {} if args.startup else run_benchmarks(quick=args.quick)
+    results.update(run_startup_benchmarks(quick=args.quick))
+    report = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": {name: {k: float(v) for k, v in metrics.items()} for name, metrics in results.items()},
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} performance regression(s) against {args.baseline}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        print(f"No baseline found at {args.baseline}, run with --update-baseline to create one.", file=sys.stderr)
@@ -1,9 +1,33 @@
+import time
 import numpy as np
+import torch as th
 from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.logger import Image
+from monitor import tile
+from profiler import BIN_CENTERS, histogram_summary, process_stats
+
+
+# Per-episode metrics aggregated for each scenario bucket (summed, then averaged on logging)
+SCENARIO_METRICS = (
+    "episode_length",
+    "episode_reward",
+    "proximity_time",
+    "on_track_time",
+    "off_track_time",
+    "collision",
+)
+
+
+def track_scenario_key(scenario: dict) -> str:
+    '''
+    Default scenario bucket: the track type ("small" / "large").
+    Vehicle count and speed ranges are tied to the track in RacetrackEnv._reset.
+    '''
+    return scenario["track"]
 
 
 class CustomMetricsCallback(BaseCallback):
-    def __init__(self, verbose=0):
+    def __init__(self, verbose=0, scenario_key=track_scenario_key, profile_log_interval=1000):
         super(CustomMetricsCallback, self).__init__(verbose)
         self.metrics = {
             "episode_length": [],
@@ -13,6 +37,95 @@ class CustomMetricsCallback(BaseCallback):
             "off_track_time": [],
             "collision": [],
         }
+        # Streaming per-scenario sums of finished episodes: bucket -> [episodes, *SCENARIO_METRICS]
+        self.scenario_key = scenario_key
+        self.scenario_sums = {}
+        # Step-phase profiler histograms of every worker at the previous log (see RacetrackEnv.profile_snapshot)
+        self.profile_log_interval = profile_log_interval
+        self.last_profiles = None
+        # custom/ values of every 50-step log, for scripts reading the metrics (hyperparameter search)
+        self.history = []
+
+    def _update_scenarios(self, infos, dones) -> None:
+        '''
+        Accumulate the final info of every finished episode into its scenario bucket.
+        '''
+        for info, done in zip(infos, dones):
+            if not done or "scenario" not in info:
+                continue
+            bucket = self.scenario_key(info["scenario"])
+            sums = self.scenario_sums.get(bucket)
+            if sums is None:
+                sums = self.scenario_sums[bucket] = np.zeros(len(SCENARIO_METRICS) + 1)
+            sums[0] += 1
+            for i, key in enumerate(SCENARIO_METRICS, start=1):
+                sums[i] += info[key]
+
+    def _log_scenarios(self) -> None:
+        '''
+        Log per-scenario means and the share of simulated time spent in each scenario.
+        '''
+        total_time = sum(sums[1] for sums in self.scenario_sums.values())
+        for bucket, sums in self.scenario_sums.items():
+            episodes = sums[0]
+            prefix = f"custom/scenario/{bucket}/"
+            self.logger.record(prefix + "episodes", episodes)
+            for i, key in enumerate(SCENARIO_METRICS, start=1):
+                if key == "collision":
+                    self.logger.record(prefix + "collision_percentage", sums[i] * 100 / episodes)
+                else:
+                    self.logger.record(prefix + "mean_" + key, sums[i] / episodes)
+            if total_time > 0:
+                self.logger.record(prefix + "time_share", sums[1] / total_time)
+
+    def _log_profiles(self) -> None:
+        '''
+        Log the step-phase latencies measured by each worker since the previous call:
+        per-worker mean per phase, and percentiles + a histogram per phase over all workers.
+        '''
+        profiles = self.training_env.env_method("profile_snapshot")
+        if not any(profiles):
+            return
+        if self.last_profiles is None:
+            self.last_profiles = [None] * len(profiles)
+
+        merged_counts = {}
+        merged_totals = {}
+        for worker, (profile, last) in enumerate(zip(profiles, self.last_profiles)):
+            if profile is None:
+                continue
+            for phase, counts in profile["counts"].items():
+                total = profile["totals"][phase]
+                if last is not None:
+                    counts = counts - last["counts"][phase]
+                    total -= last["totals"][phase]
+                if counts.sum() == 0:
+                    continue
+                self.logger.record(f"custom/profile/worker_{worker}/{phase}_mean_ms", total / counts.sum() * 1e3)
+                merged_counts[phase] = merged_counts.get(phase, 0) + counts
+                merged_totals[phase] = merged_totals.get(phase, 0.0) + total
+        self.last_profiles = profiles
+
+        for phase, counts in merged_counts.items():
+            for key, value in histogram_summary(counts, merged_totals[phase]).items():
+                self.logger.record(f"custom/profile/{phase}/{key}", value)
+            # Tensor values are written as TensorBoard histograms and skipped by the text outputs
+            self.logger.record(
+                f"custom/profile/{phase}/latency_ms",
+                th.as_tensor(np.repeat(BIN_CENTERS * 1e3, counts)),
+                exclude=("stdout", "log", "json", "csv"),
+            )
+
+    def _log_observation_cache(self) -> None:
+        '''
+        Log the on_road cache hit rate and size, averaged over the workers using CachedOccupancyGrid.
+        '''
+        stats = [s for s in self.training_env.env_method("observation_cache_stats") if s is not None]
+        if not stats:
+            return
+        self.logger.record("custom/observation_cache/hit_rate", np.mean([s["hit_rate"] for s in stats]))
+        self.logger.record("custom/observation_cache/entries", np.mean([s["entries"] for s in stats]))
+        self.logger.record("custom/observation_cache/megabytes", np.mean([s["bytes"] for s in stats]) / 1e6)
 
     def _on_step(self) -> bool:
         # Collect environment info
@@ -26,6 +139,10 @@ class CustomMetricsCallback(BaseCallback):
                 self.metrics["off_track_time"].append(info["off_track_time"])
                 self.metrics["collision"].append(info["collision"])
 
+        dones = self.locals.get("dones")
+        if dones is not None:
+            self._update_scenarios(infos, dones)
+
         # Log every 50 steps
         if self.n_calls % 50 == 0:
             if self.metrics["episode_length"]:
@@ -53,6 +170,150 @@ class CustomMetricsCallback(BaseCallback):
                     "custom/collision_percentage",
                     np.sum(self.metrics["collision"]) * 100 / 250,
                 )
+                self.history.append({
+                    key: value for key, value in self.logger.name_to_value.items()
+                    if key.startswith("custom/") and key.count("/") == 1
+                })
+            if self.scenario_sums:
+                self._log_scenarios()
             # Clear the metrics
             self.metrics = {key: [] for key in self.metrics}
+            self.scenario_sums = {}
+
+        if self.profile_log_interval and self.n_calls % self.profile_log_interval == 0:
+            self._log_profiles()
+            self._log_observation_cache()
+        return True
+
+
+class TelemetryCallback(BaseCallback):
+    '''
+    Training resource telemetry, logged under custom/telemetry/:
+    - collection time (inside collect_rollouts) versus update time (between rollouts: gradient steps, or waiting
+      on the learner with AsyncOffPolicyLearner), per rollout and as a fraction of the wall time
+    - env steps/sec, in total and per worker, and episode ends per 1k steps / per second
+    - resident memory of the learner and of every env worker, and each worker's CPU utilization
+
+    Collection / update times are aggregated over windows of at least log_interval steps (rollouts of
+    off-policy algorithms are a few steps long). Workers are queried every worker_log_interval steps.
+    '''
+
+    def __init__(self, verbose=0, log_interval=1000, worker_log_interval=5000):
+        super(TelemetryCallback, self).__init__(verbose)
+        self.log_interval = log_interval
+        self.worker_log_interval = worker_log_interval
+        self.rollout_start = None
+        self.rollout_end = None
+        self.last_workers = None        # pid -> (cpu_time, wall time) at the previous worker query
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self.rollouts = 0
+        self.steps = 0
+        self.episode_ends = 0
+        self.collection_time = 0.0
+        self.update_time = 0.0
+
+    def _on_rollout_start(self) -> None:
+        self.rollout_start = time.perf_counter()
+        if self.rollout_end is not None:
+            self.update_time += self.rollout_start - self.rollout_end
+
+    def _on_rollout_end(self) -> None:
+        self.rollout_end = time.perf_counter()
+        self.collection_time += self.rollout_end - self.rollout_start
+        self.rollouts += 1
+        if self.steps >= self.log_interval:
+            self._log_window()
+
+    def _log_window(self) -> None:
+        transitions = self.steps * self.training_env.num_envs
+        wall_time = self.collection_time + self.update_time
+        prefix = "custom/telemetry/"
+        self.logger.record(prefix + "collection_s_per_rollout", self.collection_time / self.rollouts)
+        self.logger.record(prefix + "update_s_per_rollout", self.update_time / self.rollouts)
+        self.logger.record(prefix + "collection_fraction", self.collection_time / wall_time)
+        self.logger.record(prefix + "env_steps_per_sec", transitions / self.collection_time)
+        self.logger.record(prefix + "env_steps_per_sec_per_worker", self.steps / self.collection_time)
+        self.logger.record(prefix + "training_steps_per_sec", transitions / wall_time)
+        self.logger.record(prefix + "episode_ends_per_1k_steps", self.episode_ends * 1000 / transitions)
+        self.logger.record(prefix + "episode_ends_per_sec", self.episode_ends / self.collection_time)
+        self._reset_window()
+
+    def _log_workers(self) -> None:
+        prefix = "custom/telemetry/"
+        now = time.perf_counter()
+        learner = process_stats()
+        if learner["rss"] is not None:
+            self.logger.record(prefix + "learner_rss_mb", learner["rss"] / 1e6)
+
+        # One entry per worker process (multi-agent slots share their simulation's worker)
+        workers = {stats["pid"]: stats for stats in self.training_env.env_method("process_stats")}
+        rss = [stats["rss"] for stats in workers.values() if stats["rss"] is not None]
+        if rss:
+            self.logger.record(prefix + "worker_rss_mb_total", sum(rss) / 1e6)
+            self.logger.record(prefix + "worker_rss_mb_max", max(rss) / 1e6)
+        for worker, (pid, stats) in enumerate(workers.items()):
+            if stats["rss"] is not None:
+                self.logger.record(f"{prefix}worker_{worker}/rss_mb", stats["rss"] / 1e6)
+            if self.last_workers is not None and pid in self.last_workers:
+                cpu_time, wall_time = self.last_workers[pid]
+                self.logger.record(f"{prefix}worker_{worker}/cpu_utilization", (stats["cpu_time"] - cpu_time) / (now - wall_time))
+        self.last_workers = {pid: (stats["cpu_time"], now) for pid, stats in workers.items()}
+
+    def _on_step(self) -> bool:
+        self.steps += 1
+        dones = self.locals.get("dones")
+        if dones is not None:
+            self.episode_ends += int(np.sum(dones))
+        if self.worker_log_interval and self.n_calls % self.worker_log_interval == 0:
+            self._log_workers()
         return True
+
+
+class MosaicMonitorCallback(BaseCallback):
+    '''
+    Live view of training: every `interval` steps, the first `n_envs` env workers render a headless frame of their
+    track (see monitor.py), tiled into one mosaic logged as the TensorBoard image monitor/mosaic, or appended to
+    the video file `video_path` (needs imageio, with imageio-ffmpeg for .mp4).
+    TensorBoard keeps the last mosaic recorded before each log dump, so `interval` should not be shorter than
+    the dump period. Multi-agent envs show every agent of a simulation in the same frame.
+    '''
+
+    def __init__(self, verbose=0, interval=5000, n_envs=4, frame_size=160, video_path=None, fps=4):
+        super(MosaicMonitorCallback, self).__init__(verbose)
+        self.interval = interval
+        self.n_envs = n_envs
+        self.frame_size = frame_size
+        self.video_path = video_path
+        self.fps = fps
+        self.writer = None
+
+    def _init_callback(self) -> None:
+        # Workers (simulations), not multi-agent slots
+        workers = getattr(self.training_env, "n_sims", self.training_env.num_envs)
+        self.indices = list(range(min(self.n_envs, workers)))
+        if self.video_path is not None and self.writer is None:
+            try:
+                import imageio.v2 as imageio
+            except ImportError as error:
+                raise ImportError("Writing the monitor video needs imageio: pip install imageio imageio-ffmpeg") from error
+            self.writer = imageio.get_writer(self.video_path, fps=self.fps)
+
+    def _log_mosaic(self) -> None:
+        frames = self.training_env.env_method("monitor_frame", self.frame_size, indices=self.indices)
+        mosaic = tile(frames)
+        if self.writer is not None:
+            self.writer.append_data(mosaic)
+        else:
+            self.logger.record("monitor/mosaic", Image(mosaic, "HWC"), exclude=("stdout", "log", "json", "csv"))
+
+    def _on_step(self) -> bool:
+        if self.interval and self.n_calls % self.interval == 0:
+            self._log_mosaic()
+        return True
+
+    def _on_training_end(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,454 @@
+'''
+Distributed actor / learner training over sockets.
+
+Actors (possibly on other nodes) run a copy of the policy on their own vectorized RacetrackEnvs and stream
+batched transitions to a single learner, which trains the SB3 model and sends the policy weights back
+every `sync_interval` updates (on-policy) or batches (off-policy). The transport is
+multiprocessing.connection over TCP (tcp://host:port) or a Unix socket (unix:///path).
+
+Every message from an actor is answered right away ("continue" or new weights), so an actor collects its
+next batch while the learner trains. PPO / A2C use the log-probabilities of the (possibly stale) policy
+that collected the rollout; with sync_interval=1 the learner answers after training and rollouts are fully
+on-policy.
+
+Learner:  python distributed.py learner --algo PPO --actors 2 --timesteps 1000000 --run-name dist
+Actor:    python distributed.py actor --address tcp://<learner host>:6000 --envs 8
+'''
+
+import argparse
+import multiprocessing
+import os
+import secrets
+import time
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener, wait
+
+import numpy as np
+import torch as th
+from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
+from stable_baselines3.common.utils import obs_as_tensor
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:6000"
+# Connections unpickle what they receive: a peer with the key can run code on this host. TCP addresses, loopback
+# included (open to every local user), need a secret key; only Unix sockets, protected by the file permissions,
+# fall back to LOCAL_AUTHKEY.
+AUTHKEY_VARIABLE = "RACETRACK_AUTHKEY"
+LOCAL_AUTHKEY = b"racetrack-local"
+
+
+def parse_address(address: str):
+    '''
+    tcp://host:port or unix:///path -> (multiprocessing.connection address, family)
+    '''
+    if address.startswith("unix://"):
+        return address[len("unix://"):], "AF_UNIX"
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://"):].rsplit(":", 1)
+        return (host, int(port)), "AF_INET"
+    raise ValueError(f"Unsupported address: {address} (expected tcp://host:port or unix:///path)")
+
+
+def address_authkey(address: str) -> bytes:
+    '''
+    Key of the connections on address: RACETRACK_AUTHKEY, required unless the address is a Unix socket.
+    '''
+    key = os.environ.get(AUTHKEY_VARIABLE)
+    if key:
+        return key.encode()
+    if parse_address(address)[1] == "AF_UNIX":
+        return LOCAL_AUTHKEY
+    raise RuntimeError(
+        f"Set {AUTHKEY_VARIABLE} to a secret shared by both ends to use {address}: "
+        "connections unpickle what they receive, so anyone with the key can run code on this host"
+    )
+
+
+def listen(address: str, authkey: bytes | None = None) -> Listener:
+    authkey = authkey or address_authkey(address)
+    address, family = parse_address(address)
+    if family == "AF_UNIX" and os.path.exists(address):
+        os.unlink(address)      # Stale socket of a previous run that did not shut down cleanly
+    return Listener(address, family=family, authkey=authkey)
+
+
+def connect(address: str, authkey: bytes | None = None, timeout: float = 120):
+    '''
+    Connect to a listener, retrying until it is up (actors may start before the learner).
+    '''
+    authkey = authkey or address_authkey(address)
+    address, family = parse_address(address)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return Client(address, family=family, authkey=authkey)
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def policy_weights(model) -> dict:
+    '''
+    CPU weights the actors need: the whole policy on-policy, only the actor network off-policy.
+    '''
+    module = model.policy.actor if isinstance(model, OffPolicyAlgorithm) else model.policy
+    return {key: value.cpu() for key, value in module.state_dict().items()}
+
+
+def load_weights(policy, off_policy: bool, weights: dict) -> None:
+    (policy.actor if off_policy else policy).load_state_dict(weights)
+
+
+# ----------------------------------------------------------------------------- actor
+
+def collect_rollout(policy, env, obs, episode_starts, n_steps: int, gamma: float):
+    '''
+    On-policy rollout of n_steps, same bookkeeping as OnPolicyAlgorithm.collect_rollouts.
+    '''
+    n_envs = env.num_envs
+    rollout = {
+        "observations": np.zeros((n_steps, n_envs, *env.observation_space.shape), dtype=np.float32),
+        "actions": np.zeros((n_steps, n_envs, *env.action_space.shape), dtype=np.float32),
+        "rewards": np.zeros((n_steps, n_envs), dtype=np.float32),
+        "episode_starts": np.zeros((n_steps, n_envs), dtype=np.float32),
+        "values": np.zeros((n_steps, n_envs), dtype=np.float32),
+        "log_probs": np.zeros((n_steps, n_envs), dtype=np.float32),
+        "episodes": [],
+    }
+    for step in range(n_steps):
+        with th.no_grad():
+            actions, values, log_probs = policy(obs_as_tensor(obs, policy.device))
+        actions = actions.cpu().numpy()
+        new_obs, rewards, dones, infos = env.step(np.clip(actions, env.action_space.low, env.action_space.high))
+
+        for idx, done in enumerate(dones):
+            # Bootstrap truncated episodes with the value of their terminal observation
+            if done and infos[idx].get("terminal_observation") is not None and infos[idx].get("TimeLimit.truncated", False):
+                terminal_obs = policy.obs_to_tensor(infos[idx]["terminal_observation"])[0]
+                with th.no_grad():
+                    rewards[idx] += gamma * policy.predict_values(terminal_obs)[0].item()
+            if "episode" in infos[idx]:
+                rollout["episodes"].append(infos[idx]["episode"])
+
+        rollout["observations"][step] = obs
+        rollout["actions"][step] = actions
+        rollout["rewards"][step] = rewards
+        rollout["episode_starts"][step] = episode_starts
+        rollout["values"][step] = values.cpu().numpy().flatten()
+        rollout["log_probs"][step] = log_probs.cpu().numpy()
+        obs, episode_starts = new_obs, dones
+
+    with th.no_grad():
+        rollout["last_values"] = policy.predict_values(obs_as_tensor(obs, policy.device)).cpu().numpy().flatten()
+    rollout["dones"] = episode_starts
+    return rollout, obs, episode_starts
+
+
+def collect_transitions(policy, env, obs, n_steps: int, action_noise=None):
+    '''
+    n_steps of off-policy transitions, actions stored scaled to [-1, 1] like OffPolicyAlgorithm._sample_action.
+    '''
+    n_envs = env.num_envs
+    batch = {
+        "observations": np.zeros((n_steps, n_envs, *env.observation_space.shape), dtype=np.float32),
+        "next_observations": np.zeros((n_steps, n_envs, *env.observation_space.shape), dtype=np.float32),
+        "actions": np.zeros((n_steps, n_envs, *env.action_space.shape), dtype=np.float32),
+        "rewards": np.zeros((n_steps, n_envs), dtype=np.float32),
+        "dones": np.zeros((n_steps, n_envs), dtype=bool),
+        "truncated": np.zeros((n_steps, n_envs), dtype=bool),
+        "episodes": [],
+    }
+    for step in range(n_steps):
+        actions, _ = policy.predict(obs, deterministic=False)
+        buffer_actions = policy.scale_action(actions)
+        if action_noise is not None:
+            noise = np.array([action_noise() for _ in range(n_envs)])
+            buffer_actions = np.clip(buffer_actions + noise, -1, 1)
+            actions = policy.unscale_action(buffer_actions)
+        new_obs, rewards, dones, infos = env.step(actions)
+
+        batch["observations"][step] = obs
+        batch["next_observations"][step] = new_obs
+        for idx, done in enumerate(dones):
+            if done:
+                batch["next_observations"][step, idx] = infos[idx]["terminal_observation"]
+                batch["truncated"][step, idx] = infos[idx].get("TimeLimit.truncated", False)
+            if "episode" in infos[idx]:
+                batch["episodes"].append(infos[idx]["episode"])
+        batch["actions"][step] = buffer_actions
+        batch["rewards"][step] = rewards
+        batch["dones"][step] = dones
+        obs = new_obs
+    return batch, obs
+
+
+def make_actor_env(n_envs: int):
+    from train_model import WORKER_PRELOAD, create_custom_racetrack_env
+
+    multiprocessing.set_forkserver_preload(WORKER_PRELOAD)
+    env_fns = [create_custom_racetrack_env for _ in range(n_envs)]
+    return VecMonitor(SubprocVecEnv(env_fns) if n_envs > 1 else DummyVecEnv(env_fns))
+
+
+def run_actor(address: str, n_envs: int, device: str = "cpu", env=None, authkey: bytes | None = None) -> None:
+    '''
+    Connect to the learner and stream batches until it sends "stop".
+    env: vectorized env to use instead of creating n_envs new ones (left open).
+    authkey: key of the learner (default: address_authkey).
+    '''
+    conn = connect(address, authkey)
+    own_env = env is None
+    env = env or make_actor_env(n_envs)
+    conn.send(("hello", env.num_envs))
+    _, setup = conn.recv()
+
+    policy = setup["policy_class"](**setup["policy_kwargs"]).to(device)
+    load_weights(policy, setup["off_policy"], setup["weights"])
+    policy.set_training_mode(False)
+
+    obs = env.reset()
+    episode_starts = np.ones(env.num_envs, dtype=bool)
+    while True:
+        if setup["off_policy"]:
+            batch, obs = collect_transitions(policy, env, obs, setup["n_steps"], setup["action_noise"])
+        else:
+            batch, obs, episode_starts = collect_rollout(policy, env, obs, episode_starts, setup["n_steps"], setup["gamma"])
+        conn.send(("batch", batch))
+        cmd, data = conn.recv()
+        if cmd == "stop":
+            break
+        if cmd == "weights":
+            load_weights(policy, setup["off_policy"], data)
+
+    if own_env:
+        env.close()
+    conn.close()
+
+
+# ----------------------------------------------------------------------------- learner
+
+class Learner:
+    '''
+    Accepts n_actors connections and trains `model` on their batches.
+    model: SB3 model built on a local env (only used for the spaces and SB3's bookkeeping).
+    '''
+
+    def __init__(self, model, address: str, n_actors: int, sync_interval: int = 1, batch_steps: int = 64,
+                 authkey: bytes | None = None):
+        self.model = model
+        self.off_policy = isinstance(model, OffPolicyAlgorithm)
+        self.sync_interval = sync_interval
+        self.n_steps = batch_steps if self.off_policy else model.n_steps
+        self.listener = listen(address, authkey)
+        self.actors = []            # Connections
+        self.actor_envs = []        # Envs of each actor
+        self.waiting = set()        # Actors waiting for an answer
+        for _ in range(n_actors):
+            conn = self.listener.accept()
+            _, n_envs = conn.recv()
+            self.actors.append(conn)
+            self.actor_envs.append(n_envs)
+
+        setup = {
+            "off_policy": self.off_policy,
+            "policy_class": type(model.policy),
+            "policy_kwargs": model.policy._get_constructor_parameters(),
+            "weights": policy_weights(model),
+            "n_steps": self.n_steps,
+            "gamma": model.gamma,
+            "action_noise": getattr(model, "action_noise", None),
+        }
+        for conn in self.actors:
+            conn.send(("setup", setup))
+
+    def answer(self, conn, weights: dict | None = None) -> None:
+        conn.send(("weights", weights) if weights is not None else ("continue", None))
+        self.waiting.discard(conn)
+
+    def receive(self, conn) -> dict:
+        _, batch = conn.recv()
+        self.waiting.add(conn)
+        self.model.ep_info_buffer.extend(batch["episodes"])
+        self.model._episode_num += len(batch["episodes"])
+        return batch
+
+    def learn(self, total_timesteps: int, tb_log_name: str = "run", log_interval: int = 1):
+        total_timesteps, _ = self.model._setup_learn(total_timesteps, tb_log_name=tb_log_name)
+        if self.off_policy:
+            self._learn_off_policy(total_timesteps, log_interval)
+        else:
+            self._learn_on_policy(total_timesteps, log_interval)
+        return self.model
+
+    def _learn_on_policy(self, total_timesteps: int, log_interval: int) -> None:
+        model = self.model
+        n_envs = sum(self.actor_envs)
+        columns = np.cumsum([0] + self.actor_envs)
+        model.rollout_buffer = model.rollout_buffer_class(
+            model.n_steps,
+            model.observation_space,
+            model.action_space,
+            device=model.device,
+            gamma=model.gamma,
+            gae_lambda=model.gae_lambda,
+            n_envs=n_envs,
+            **model.rollout_buffer_kwargs,
+        )
+        buffer = model.rollout_buffer
+        iteration = 0
+        while model.num_timesteps < total_timesteps:
+            iteration += 1
+            sync = iteration % self.sync_interval == 0
+            buffer.reset()
+            last_values = np.zeros(n_envs, dtype=np.float32)
+            dones = np.zeros(n_envs, dtype=np.float32)
+
+            pending = set(self.actors)
+            while pending:
+                for conn in wait(list(pending)):
+                    pending.remove(conn)
+                    rollout = self.receive(conn)
+                    if not sync:
+                        self.answer(conn)       # The actor starts its next rollout with its current weights
+                    start, end = columns[self.actors.index(conn)], columns[self.actors.index(conn) + 1]
+                    for key in ("observations", "actions", "rewards", "episode_starts", "values", "log_probs"):
+                        getattr(buffer, key)[:, start:end] = rollout[key].reshape(getattr(buffer, key)[:, start:end].shape)
+                    last_values[start:end] = rollout["last_values"]
+                    dones[start:end] = rollout["dones"]
+            buffer.pos, buffer.full = buffer.buffer_size, True
+
+            model.num_timesteps += model.n_steps * n_envs
+            buffer.compute_returns_and_advantage(last_values=th.as_tensor(last_values), dones=dones)
+            model._update_current_progress_remaining(model.num_timesteps, total_timesteps)
+            if log_interval is not None and iteration % log_interval == 0:
+                model.dump_logs(iteration)
+            model.train()
+
+            if sync:
+                weights = policy_weights(model)
+                for conn in list(self.waiting):
+                    self.answer(conn, weights)
+
+    def _learn_off_policy(self, total_timesteps: int, log_interval: int) -> None:
+        model = self.model
+        # One replay buffer column per actor env, filled with whole vectorized steps: buffers storing next_obs
+        # at the following index (PackedReplayBuffer, optimize_memory_usage) need consecutive adds of the same env
+        model.replay_buffer = model.replay_buffer_class(
+            model.buffer_size,
+            model.observation_space,
+            model.action_space,
+            device=model.device,
+            n_envs=sum(self.actor_envs),
+            optimize_memory_usage=model.optimize_memory_usage,
+            **model.replay_buffer_kwargs,
+        )
+        rounds = 0
+        while model.num_timesteps < total_timesteps:
+            rounds += 1
+            sync = rounds % self.sync_interval == 0
+            weights = policy_weights(model) if sync else None
+            batches = {}
+            pending = set(self.actors)
+            while pending:
+                for conn in wait(list(pending)):
+                    pending.remove(conn)
+                    batches[conn] = self.receive(conn)
+                    # Answer before training, so that the actor collects its next batch meanwhile
+                    self.answer(conn, weights)
+
+            # (n_steps, n_envs of every actor, ...) in the column order of the replay buffer
+            batch = {
+                key: np.concatenate([batches[conn][key] for conn in self.actors], axis=1)
+                for key in ("observations", "next_observations", "actions", "rewards", "dones", "truncated")
+            }
+            n_steps, n_envs = batch["rewards"].shape
+            for step in range(n_steps):
+                model.replay_buffer.add(
+                    batch["observations"][step],
+                    batch["next_observations"][step],
+                    batch["actions"][step],
+                    batch["rewards"][step],
+                    batch["dones"][step],
+                    [{"TimeLimit.truncated": truncated} for truncated in batch["truncated"][step]],
+                )
+            model.num_timesteps += n_steps * n_envs
+
+            if model.num_timesteps > model.learning_starts:
+                model._update_current_progress_remaining(model.num_timesteps, total_timesteps)
+                # Same update ratio as train_freq=1 step: gradient_steps per vectorized step of each actor
+                model.train(gradient_steps=len(self.actors) * n_steps * model.gradient_steps, batch_size=model.batch_size)
+            if log_interval is not None and rounds % log_interval == 0:
+                model.dump_logs()
+
+    def close(self) -> None:
+        for conn in self.actors:
+            if conn not in self.waiting:
+                conn.recv()     # The actor is collecting, wait for its batch
+            conn.send(("stop", None))
+            conn.close()
+        self.listener.close()
+
+
+def run_learner(algo: str, address: str, n_actors: int, total_timesteps: int, run_name: str, device: str,
+                sync_interval: int, batch_steps: int, spawn_actors: int = 0, envs_per_actor: int = 1) -> None:
+    from train_model import create_custom_racetrack_env, logs_folder, make_model, models_folder
+
+    if spawn_actors >= n_actors and not os.environ.get(AUTHKEY_VARIABLE):
+        authkey = secrets.token_bytes(32)       # Only known to this run: every actor is spawned here
+    else:
+        authkey = address_authkey(address)      # Fail before starting anything without a key for a TCP address
+    # Local actors, for single-node runs and testing the transport
+    processes = [
+        Process(target=run_actor, args=(address, envs_per_actor), kwargs={"authkey": authkey})
+        for _ in range(spawn_actors)
+    ]
+    for process in processes:
+        process.start()
+
+    env = DummyVecEnv([create_custom_racetrack_env])
+    model = make_model(algo, env, os.path.join(logs_folder, run_name), device)
+    print(f"Waiting for {n_actors} actors on {address}...")
+    learner = Learner(model, address, n_actors, sync_interval=sync_interval, batch_steps=batch_steps, authkey=authkey)
+    print(f"Training {algo} on {sum(learner.actor_envs)} remote environments for {total_timesteps} timesteps...")
+    try:
+        learner.learn(total_timesteps, tb_log_name=run_name, log_interval=1 if not learner.off_policy else 10)
+    finally:
+        learner.close()
+        for process in processes:
+            process.join()
+        env.close()
+
+    model.save(os.path.join(models_folder, run_name))
+    print(f"Model saved successfully as {run_name}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed actor / learner training")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    learner_parser = subparsers.add_parser("learner")
+    learner_parser.add_argument("--algo", choices=["PPO", "A2C", "SAC", "TD3"], default="PPO")
+    learner_parser.add_argument("--address", default=DEFAULT_ADDRESS, help="tcp://host:port or unix:///path")
+    learner_parser.add_argument("--actors", type=int, required=True, help="number of actors to wait for")
+    learner_parser.add_argument("--timesteps", type=int, required=True)
+    learner_parser.add_argument("--run-name", required=True)
+    learner_parser.add_argument("--device", default="cpu")
+    learner_parser.add_argument("--sync-interval", type=int, default=1, help="updates / batches between weight broadcasts")
+    learner_parser.add_argument("--batch-steps", type=int, default=64, help="off-policy steps per actor batch")
+    learner_parser.add_argument("--spawn-actors", type=int, default=0, help="local actors to start")
+    learner_parser.add_argument("--envs-per-actor", type=int, default=1, help="envs of the local actors")
+
+    actor_parser = subparsers.add_parser("actor")
+    actor_parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    actor_parser.add_argument("--envs", type=int, default=os.cpu_count())
+    actor_parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    if args.role == "learner":
+        run_learner(
+            args.algo, args.address, args.actors, args.timesteps, args.run_name, args.device,
+            args.sync_interval, args.batch_steps, args.spawn_actors, args.envs_per_actor,
+        )
+    else:
+        run_actor(args.address, args.envs, args.device)
@@ -0,0 +1,66 @@
+'''
+Worker side of SubprocVecEnv's pipe protocol, shared by AsyncVecEnv's workers and the worker pool.
+
+serve_env answers the commands of stable-baselines3's SubprocVecEnv (step, reset, render, get_spaces,
+env_method, get_attr, has_attr, set_attr, is_wrapped, close) on an existing env, the same way as the stock
+subproc_vec_env._worker loop, and leaves creating and closing the env to its caller.
+'''
+
+from stable_baselines3.common.env_util import is_wrapped
+
+
+def serve_env(remote, env, reset_after_send: bool = False) -> None:
+    '''
+    Answer the commands received on remote until "close" or the connection drops. The env is left open.
+
+    :param reset_after_send: when an episode ends, send the step result (without reset info) first and reset
+        afterwards, the (reset observation, reset info) being sent as a separate message (AsyncVecEnv).
+        Otherwise the step result carries the reset observation and info, like SubprocVecEnv.
+    '''
+    reset_info = {}
+    while True:
+        try:
+            cmd, data = remote.recv()
+        except EOFError:
+            return
+        if cmd == "step":
+            observation, reward, terminated, truncated, info = env.step(data)
+            done = terminated or truncated
+            info["TimeLimit.truncated"] = truncated and not terminated
+            if done:
+                info["terminal_observation"] = observation
+            if reset_after_send:
+                remote.send((observation, reward, done, info))
+                if done:
+                    remote.send(env.reset())
+                continue
+            if done:
+                observation, reset_info = env.reset()
+            remote.send((observation, reward, done, info, reset_info))
+        elif cmd == "reset":
+            maybe_options = {"options": data[1]} if data[1] else {}
+            observation, reset_info = env.reset(seed=data[0], **maybe_options)
+            remote.send((observation, reset_info))
+        elif cmd == "render":
+            remote.send(env.render())
+        elif cmd == "close":
+            return
+        elif cmd == "get_spaces":
+            remote.send((env.observation_space, env.action_space))
+        elif cmd == "env_method":
+            method = env.get_wrapper_attr(data[0])
+            remote.send(method(*data[1], **data[2]))
+        elif cmd == "get_attr":
+            remote.send(env.get_wrapper_attr(data))
+        elif cmd == "has_attr":
+            try:
+                env.get_wrapper_attr(data)
+                remote.send(True)
+            except AttributeError:
+                remote.send(False)
+        elif cmd == "set_attr":
+            remote.send(setattr(env, data[0], data[1]))
+        elif cmd == "is_wrapped":
+            remote.send(is_wrapped(env, data))
+        else:
+            raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
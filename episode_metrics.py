@@ -0,0 +1,75 @@
+'''
+Episode metrics and termination state of RacetrackEnv, stored as arrays with one row per controlled
+vehicle (or per environment in a batched simulator), so that every counter, termination and truncation
+check is a single NumPy operation over all rows.
+'''
+
+import numpy as np
+
+
+class EpisodeMetrics:
+    '''
+    :param n: number of rows (agents / environments)
+    :param dt: duration of a policy step [s]
+    '''
+
+    __slots__ = (
+        "dt",
+        "episode_reward",
+        "episode_length",
+        "proximity_time",
+        "on_track_time",
+        "off_track_time",
+        "off_track",
+        "collision",
+        "crashed",
+    )
+
+    def __init__(self, n: int, dt: float):
+        self.dt = dt
+        self.episode_reward = np.zeros(n)
+        self.episode_length = np.zeros(n)
+        self.proximity_time = np.zeros(n)
+        self.on_track_time = np.zeros(n)
+        self.off_track_time = np.zeros(n)
+        self.off_track = np.zeros(n)        # Seconds since leaving the track (0 while on it)
+        self.collision = np.zeros(n)
+        self.crashed = np.zeros(n, dtype=bool)
+
+    def reset(self, rows=None) -> None:
+        '''
+        Zero every counter, of all rows or of the selected ones (index or boolean mask).
+        '''
+        rows = slice(None) if rows is None else rows
+        for name in self.__slots__[1:]:
+            getattr(self, name)[rows] = 0
+
+    def step_off_track(self, on_road: np.ndarray) -> np.ndarray:
+        '''
+        Advance the off-track timers and return the off-track penalty of each row
+        (seconds off the track, 0 on the track).
+        '''
+        self.off_track = np.where(on_road, 0, self.off_track + self.dt)
+        return self.off_track.copy()
+
+    def update(self, reward, proximity_penalty, crashed: np.ndarray, on_road: np.ndarray) -> None:
+        '''
+        Accumulate the step's reward and vehicle status.
+        reward and proximity_penalty are scalars or per-row arrays.
+        '''
+        self.crashed = crashed
+        self.episode_reward += reward
+        self.episode_length += self.dt
+        self.collision += crashed
+        self.on_track_time += on_road * self.dt
+        self.off_track_time += ~on_road * self.dt
+        self.proximity_time += (np.asarray(proximity_penalty) != 0) * self.dt
+
+    def terminated(self) -> np.ndarray:
+        return self.crashed
+
+    def truncated(self, time, duration: float, off_track_threshold: float) -> np.ndarray:
+        '''
+        time: elapsed time of each row (or of all of them)
+        '''
+        return (np.asarray(time) >= duration) | (self.off_track_time >= off_track_threshold)
@@ -0,0 +1,156 @@
+'''
+Evaluation result cache.
+
+Deterministic evaluations of a checkpoint are stored per (model file hash, evaluation settings hash), where the
+settings are the env config, the policy runtime and the NumPy / highway-env versions. Each store is one columnar
+.npz file in models_v2/evaluations/ with one row per seed and one column per metric (episode_reward, collision,
+off_track_time, proximity_time, episode_length). Evaluating a seed list reads the cached rows and only simulates
+the missing seeds, which are then added to the file. With the numpy runtime the evaluated export must have
+been made from the model file as it is now (its embedded source hash), so rows are never those of an old actor.
+
+Episodes are seeded and replay bit-exactly (see replay.py), so a cached row is the result the episode would have
+now. Clear the folder after changing the simulator, observation or reward code (replay.py check fails then).
+
+Usage:
+    python evaluation_cache.py --algo SAC --model sac_run --seeds 0 100        # episodes with seeds 0..99
+    python evaluation_cache.py --algo PPO --model ppo_run --seeds 0 100 --runtime numpy
+'''
+
+import argparse
+import hashlib
+import json
+import os
+
+import highway_env
+import numpy as np
+from policy_export import file_hash
+from racetrack_env import RacetrackEnv
+
+current_folder = os.path.dirname(os.path.abspath(__file__))
+evaluations_folder = os.path.join(current_folder, "models_v2", "evaluations")
+
+# Final info values stored per episode
+METRICS = ("episode_reward", "collision", "off_track_time", "proximity_time", "episode_length")
+
+
+def settings_hash(settings: dict) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class EvaluationStore:
+    '''
+    Per-seed metrics of one (model file, evaluation settings) pair, kept in a columnar .npz file.
+    '''
+
+    def __init__(self, model_path: str, settings: dict, folder: str = evaluations_folder):
+        self.model_hash = file_hash(model_path)
+        self.settings_hash = settings_hash(settings)
+        self.path = os.path.join(folder, f"{self.model_hash[:16]}_{self.settings_hash[:16]}.npz")
+        self.metadata = {"model": os.path.basename(model_path), "settings": json.dumps(settings, sort_keys=True, default=str)}
+        self.rows = {}          # Seed -> metric values (METRICS order)
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                columns = [data[metric] for metric in METRICS]
+                for i, seed in enumerate(data["seed"].tolist()):
+                    self.rows[seed] = tuple(column[i].item() for column in columns)
+        self.dirty = False
+
+    def missing(self, seeds: list[int]) -> list[int]:
+        return [seed for seed in dict.fromkeys(seeds) if seed not in self.rows]
+
+    def add(self, seed: int, metrics: dict) -> None:
+        self.rows[seed] = tuple(float(metrics[metric]) for metric in METRICS)
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        seeds = sorted(self.rows)
+        columns = {"seed": np.array(seeds, dtype=np.int64)}
+        for i, metric in enumerate(METRICS):
+            columns[metric] = np.array([self.rows[seed][i] for seed in seeds])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = self.path[:-len(".npz")] + ".tmp.npz"
+        np.savez_compressed(temporary, **columns, **self.metadata)
+        os.replace(temporary, self.path)        # Readers never see a partial file
+        self.dirty = False
+
+    def results(self, seeds: list[int]) -> dict[str, np.ndarray]:
+        '''
+        Columns (seed and METRICS) of the given seeds, in their order. Every seed must be in the store.
+        '''
+        rows = [self.rows[seed] for seed in seeds]
+        results = {"seed": np.array(seeds, dtype=np.int64)}
+        for i, metric in enumerate(METRICS):
+            results[metric] = np.array([row[i] for row in rows])
+        return results
+
+
+def run_episode(env, policy, seed: int) -> dict:
+    '''
+    Final info of a deterministic episode of policy (SB3 model or NumpyPolicy) from reset(seed=seed).
+    '''
+    obs, _ = env.reset(seed=seed)
+    done = False
+    while not done:
+        action, _ = policy.predict(obs, deterministic=True)
+        obs, _, terminated, truncated, info = env.step(action)
+        done = terminated or truncated
+    return info
+
+
+def evaluate(policy, model_path: str, seeds: list[int], config: dict | None = None, runtime: str = "torch",
+             verbose: bool = True) -> dict[str, np.ndarray]:
+    '''
+    Per-episode metrics of policy (loaded from model_path) on the given seeds, simulating only the seeds
+    missing from the cache. Returns {"seed": seeds, metric: values} columns in the order of seeds.
+    With the numpy runtime, policy is a NumpyPolicy that must have been exported from model_path as it is now.
+    '''
+    env_config = RacetrackEnv.default_config()
+    env_config.update(config or {})         # As configured: reset() overwrites the scenario values of env.config
+    env = RacetrackEnv(config=config)
+    settings = {
+        "env": env_config,
+        "runtime": runtime,
+        "versions": {"numpy": np.__version__, "highway_env": getattr(highway_env, "__version__", None)},
+    }
+    store = EvaluationStore(model_path, settings)
+    if runtime == "numpy" and policy.metadata.get("source_hash") != store.model_hash:
+        # Results of another actor must not be stored under the hash of this model file
+        raise ValueError(f"The NumPy policy was not exported from the current {model_path}, export it again")
+    missing = store.missing(seeds)
+    if verbose:
+        print(f"Evaluation of {os.path.basename(model_path)}: {len(seeds) - len(missing)} cached episodes, "
+              f"{len(missing)} to simulate")
+    try:
+        for seed in missing:
+            store.add(seed, run_episode(env, policy, seed))
+    finally:
+        store.save()        # Keep the finished episodes of an interrupted evaluation
+        env.close()
+    return store.results(list(seeds))
+
+
+def summary(results: dict[str, np.ndarray]) -> str:
+    return ", ".join(f"{metric} {results[metric].mean():.3f}" for metric in METRICS)
+
+
+if __name__ == "__main__":
+    from policy_export import NumpyPolicy, exported_path, export_policy, is_current, load_model, model_file
+
+    parser = argparse.ArgumentParser(description="Evaluate a checkpoint on seeded episodes, with cached results")
+    parser.add_argument("--algo", choices=["PPO", "A2C", "SAC", "TD3"], required=True)
+    parser.add_argument("--model", required=True, help="model name in models_v2/")
+    parser.add_argument("--seeds", type=int, nargs=2, default=[0, 100], metavar=("FIRST", "STOP"), help="seed range")
+    parser.add_argument("--runtime", choices=["torch", "numpy"], default="torch")
+    args = parser.parse_args()
+
+    model_path = model_file(args.model)
+    if args.runtime == "numpy":
+        if not is_current(exported_path(args.model), model_path):
+            export_policy(load_model(args.algo, args.model), exported_path(args.model), model_path)
+        policy = NumpyPolicy(exported_path(args.model))
+    else:
+        policy = load_model(args.algo, args.model)
+    results = evaluate(policy, model_path, list(range(*args.seeds)), runtime=args.runtime)
+    print(f"{len(results['seed'])} episodes: {summary(results)}")
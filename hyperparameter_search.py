@@ -0,0 +1,234 @@
+'''
+Asynchronous successive-halving (ASHA) hyperparameter search over the train_model.py configurations.
+
+Trials sample hyperparameters around the hand-picked ones of train_model.HYPERPARAMETERS and train in
+parallel, one process (one CPU) per trial, on short budgets. Every trial reaching a rung is scored from the
+CustomMetricsCallback metrics (custom/mean_episode_reward, minus a penalty on custom/collision_percentage).
+The top 1/eta of each rung are promoted to the next rung, with eta times the budget, resuming from their
+saved model (and replay buffer for SAC / TD3), and the others stop there. Free workers never wait for a rung to fill up: they promote a trial
+if one qualifies, and start a new trial otherwise.
+
+Usage:
+    python hyperparameter_search.py --algo PPO --trials 27 --workers 4 --min-timesteps 20000 --name ppo_search
+'''
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from stable_baselines3 import A2C, PPO, SAC, TD3
+
+from train_model import HYPERPARAMETERS, WORKER_PRELOAD, logs_folder
+
+ALGOS = {"PPO": PPO, "A2C": A2C, "SAC": SAC, "TD3": TD3}
+
+# Sampled hyperparameters: ("log", low, high), ("uniform", low, high) or ("choice", values)
+SEARCH_SPACES = {
+    "PPO": {
+        "learning_rate": ("log", 1e-5, 1e-3),
+        "n_steps": ("choice", [256, 512, 1024, 2048]),
+        "gamma": ("choice", [0.95, 0.98, 0.985, 0.99, 0.995]),
+        "gae_lambda": ("choice", [0.8, 0.9, 0.95, 0.98]),
+        "clip_range": ("choice", [0.1, 0.2, 0.3]),
+        "vf_coef": ("uniform", 0.2, 0.8),
+    },
+    "A2C": {
+        "learning_rate": ("log", 1e-5, 1e-3),
+        "n_steps": ("choice", [5, 20, 50, 100]),
+        "gamma": ("choice", [0.95, 0.98, 0.985, 0.99, 0.995]),
+        "gae_lambda": ("choice", [0.8, 0.9, 0.95, 0.98]),
+        "max_grad_norm": ("choice", [0.3, 0.5, 1.0]),
+    },
+    "SAC": {
+        "learning_rate": ("log", 3e-5, 1e-3),
+        "gamma": ("choice", [0.95, 0.98, 0.99, 0.995]),
+        "tau": ("choice", [0.001, 0.005, 0.01, 0.02]),
+        "batch_size": ("choice", [64, 128, 256, 512]),
+    },
+    "TD3": {
+        "learning_rate": ("log", 3e-5, 1e-3),
+        "gamma": ("choice", [0.95, 0.98, 0.99, 0.995]),
+        "tau": ("choice", [0.001, 0.005, 0.01, 0.02]),
+        "batch_size": ("choice", [64, 128, 256, 512]),
+    },
+}
+
+# Score = mean episode reward - COLLISION_WEIGHT * collision percentage
+COLLISION_WEIGHT = 10
+
+# Metric logs (every 50 steps) averaged into a trial's score at the end of a rung
+SCORE_WINDOW = 10
+
+search_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search")
+
+
+def sample_hyperparameters(algo: str, rng: np.random.Generator) -> dict:
+    params = {}
+    for name, (kind, *args) in SEARCH_SPACES[algo].items():
+        if kind == "log":
+            params[name] = float(np.exp(rng.uniform(np.log(args[0]), np.log(args[1]))))
+        elif kind == "uniform":
+            params[name] = float(rng.uniform(*args))
+        else:
+            params[name] = args[0][rng.integers(len(args[0]))]
+    return params
+
+
+def score(history: list[dict]) -> tuple[float, dict]:
+    '''
+    Score of a trial from the last SCORE_WINDOW metric logs of its CustomMetricsCallback.
+    '''
+    window = [values for values in history[-SCORE_WINDOW:] if "custom/mean_episode_reward" in values]
+    if not window:
+        return -np.inf, {}
+    reward = float(np.mean([values["custom/mean_episode_reward"] for values in window]))
+    collisions = float(np.mean([values["custom/collision_percentage"] for values in window]))
+    return reward - COLLISION_WEIGHT * collisions, {"mean_episode_reward": reward, "collision_percentage": collisions}
+
+
+def run_trial(algo: str, trial: int, params: dict, timesteps: int, n_envs: int, folder: str, search_name: str, seed: int) -> dict:
+    '''
+    Train a trial up to `timesteps` in total (resuming from its saved model, and replay buffer off-policy)
+    and return its score. Runs in a worker process, with a single-process DummyVecEnv and torch on one thread.
+    '''
+    import torch as th
+    from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from custom_metrics import CustomMetricsCallback
+    from train_model import create_custom_racetrack_env, make_model
+
+    th.set_num_threads(1)
+    model_path = os.path.join(folder, f"trial_{trial}.zip")
+    buffer_path = os.path.join(folder, f"trial_{trial}_replay_buffer.pkl")
+    env = DummyVecEnv([create_custom_racetrack_env for _ in range(n_envs)])
+    if os.path.exists(model_path):
+        model = ALGOS[algo].load(model_path, env=env, device="cpu")
+        # SAC / TD3 continue with the transitions of the previous rungs (load does not restore the buffer)
+        if isinstance(model, OffPolicyAlgorithm):
+            model.load_replay_buffer(buffer_path)
+    else:
+        overrides = dict(params)
+        if "buffer_size" in HYPERPARAMETERS[algo]:
+            overrides["buffer_size"] = min(HYPERPARAMETERS[algo]["buffer_size"], timesteps * 8)
+        model = make_model(
+            algo, env, os.path.join(logs_folder, search_name), "cpu", seed=seed + trial, verbose=0, **overrides
+        )
+
+    callback = CustomMetricsCallback(profile_log_interval=0)
+    start = time.perf_counter()
+    remaining = timesteps - model.num_timesteps
+    model.learn(remaining, callback=callback, tb_log_name=f"trial_{trial}", reset_num_timesteps=False)
+    model.save(model_path)
+    if isinstance(model, OffPolicyAlgorithm):
+        model.save_replay_buffer(buffer_path)
+    env.close()
+
+    value, metrics = score(callback.history)
+    return {"trial": trial, "timesteps": model.num_timesteps, "score": value, "metrics": metrics,
+            "seconds": time.perf_counter() - start}
+
+
+class ASHA:
+    '''
+    Asynchronous successive halving scheduler.
+    Rung k trains trials up to min_timesteps * eta**k timesteps.
+    '''
+
+    def __init__(self, n_trials: int, n_rungs: int, eta: int, min_timesteps: int):
+        self.n_trials = n_trials
+        self.eta = eta
+        self.budgets = [min_timesteps * eta**k for k in range(n_rungs)]
+        self.started = 0
+        self.rungs = [{} for _ in self.budgets]          # Rung -> {trial: score}
+        self.promoted = [set() for _ in self.budgets]
+
+    def next_job(self) -> tuple[int, int] | None:
+        '''
+        (trial, rung) to run next: a promotion from the highest possible rung, else a new trial.
+        '''
+        for rung in reversed(range(len(self.budgets) - 1)):
+            ranked = sorted(self.rungs[rung], key=self.rungs[rung].get, reverse=True)
+            for trial in ranked[:len(ranked) // self.eta]:
+                if trial not in self.promoted[rung]:
+                    self.promoted[rung].add(trial)
+                    return trial, rung + 1
+        if self.started < self.n_trials:
+            self.started += 1
+            return self.started - 1, 0
+        return None
+
+    def report(self, trial: int, rung: int, value: float) -> None:
+        self.rungs[rung][trial] = value
+
+
+def search(algo: str, n_trials: int, n_workers: int, n_envs: int, min_timesteps: int, n_rungs: int, eta: int,
+           name: str, seed: int) -> list[dict]:
+    folder = os.path.join(search_folder, name)
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    params = [sample_hyperparameters(algo, rng) for _ in range(n_trials)]
+    scheduler = ASHA(n_trials, n_rungs, eta, min_timesteps)
+    results = [{"trial": trial, "params": params[trial], "rungs": []} for trial in range(n_trials)]
+
+    ctx = mp.get_context("forkserver")
+    ctx.set_forkserver_preload(WORKER_PRELOAD + ["train_model"])
+    running = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as executor:
+        while True:
+            while len(running) < n_workers:
+                job = scheduler.next_job()
+                if job is None:
+                    break
+                trial, rung = job
+                future = executor.submit(
+                    run_trial, algo, trial, params[trial], scheduler.budgets[rung], n_envs, folder, name, seed
+                )
+                running[future] = (trial, rung)
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial, rung = running.pop(future)
+                result = future.result()
+                scheduler.report(trial, rung, result["score"])
+                results[trial]["rungs"].append({"rung": rung, **result})
+                print(f"trial {trial:3d} rung {rung} ({result['timesteps']} timesteps): score {result['score']:.2f} "
+                      f"{result['metrics']}")
+            with open(os.path.join(folder, "results.json"), "w") as f:
+                json.dump({"algo": algo, "budgets": scheduler.budgets, "trials": results}, f, indent=2)
+
+    # Cost against training every trial for the full budget
+    used = sum(rung["timesteps"] - (scheduler.budgets[rung["rung"] - 1] if rung["rung"] else 0)
+               for result in results for rung in result["rungs"])
+    full = n_trials * scheduler.budgets[-1]
+    print(f"\nSearch took {time.perf_counter() - start:.0f}s and {used} timesteps "
+          f"({used / full:.1%} of training all {n_trials} trials to {scheduler.budgets[-1]} timesteps)")
+
+    finished = [result for result in results if result["rungs"]]
+    finished.sort(key=lambda result: (result["rungs"][-1]["rung"], result["rungs"][-1]["score"]), reverse=True)
+    for result in finished[:5]:
+        best = result["rungs"][-1]
+        print(f"trial {result['trial']:3d} rung {best['rung']}: score {best['score']:.2f} {result['params']}")
+    return finished
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ASHA hyperparameter search")
+    parser.add_argument("--algo", choices=list(SEARCH_SPACES), default="PPO")
+    parser.add_argument("--trials", type=int, default=27)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="concurrent trials (one CPU each)")
+    parser.add_argument("--envs", type=int, default=4, help="environments per trial")
+    parser.add_argument("--min-timesteps", type=int, default=20000, help="budget of the first rung")
+    parser.add_argument("--rungs", type=int, default=3)
+    parser.add_argument("--eta", type=int, default=3, help="promotion ratio and budget multiplier between rungs")
+    parser.add_argument("--name", required=True, help="search name (models in search/<name>, logs in logs_v2/<name>)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    search(args.algo, args.trials, args.workers, args.envs, args.min_timesteps, args.rungs, args.eta, args.name, args.seed)
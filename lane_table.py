@@ -0,0 +1,62 @@
+'''
+Interned lane table of a road network.
+
+Every lane index ("a", "b", 0) gets an integer id. Lanes (a list), their lengths and kinds (arrays) are
+indexed by id, with the lane graph as adjacency arrays (next / previous lane along the track, left / right
+neighbor in the same section, -1 where there is none). Hot-path code and batched simulators index arrays
+with ids instead of hashing (from, to, id) tuples into the network's nested dicts.
+'''
+
+import numpy as np
+from highway_env.road.lane import CircularLane
+
+
+class LaneTable:
+    def __init__(self, network):
+        self.lane_indices = [
+            (_from, _to, lane_id)
+            for _from, to_dict in network.graph.items()
+            for _to, lanes in to_dict.items()
+            for lane_id in range(len(lanes))
+        ]
+        self.index_of = {lane_index: i for i, lane_index in enumerate(self.lane_indices)}
+        self.lanes = [network.graph[_from][_to][lane_id] for _from, _to, lane_id in self.lane_indices]
+        self.lengths = np.array([lane.length for lane in self.lanes])
+        self.circular = np.array([isinstance(lane, CircularLane) for lane in self.lanes])
+
+        n = len(self.lane_indices)
+        self.next_lane = np.full(n, -1)
+        self.previous_lane = np.full(n, -1)
+        self.left_lane = np.full(n, -1)
+        self.right_lane = np.full(n, -1)
+        for i, (_from, _to, lane_id) in enumerate(self.lane_indices):
+            # Same lane id in the first following section that has it (racetracks have a single successor)
+            for _next in network.graph.get(_to, {}):
+                successor = self.index_of.get((_to, _next, lane_id))
+                if successor is not None:
+                    self.next_lane[i] = successor
+                    if self.previous_lane[successor] < 0:
+                        self.previous_lane[successor] = i
+                    break
+            self.left_lane[i] = self.index_of.get((_from, _to, lane_id - 1), -1)
+            self.right_lane[i] = self.index_of.get((_from, _to, lane_id + 1), -1)
+
+    def __len__(self) -> int:
+        return len(self.lane_indices)
+
+    def vehicle_lane_ids(self, vehicles) -> np.ndarray:
+        '''
+        Lane id of each vehicle (-1 for a lane index outside the table).
+        '''
+        index_of = self.index_of
+        return np.fromiter((index_of.get(vehicle.lane_index, -1) for vehicle in vehicles), dtype=int, count=len(vehicles))
+
+
+# Tables of the static tracks, built once per process
+tables = {}
+
+
+def lane_table(track: str, network) -> LaneTable:
+    if track not in tables:
+        tables[track] = LaneTable(network)
+    return tables[track]
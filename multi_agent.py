@@ -0,0 +1,82 @@
+'''
+Multi-agent racing mode.
+N controlled vehicles share one road; every agent is exposed as its own slot of a VecEnv,
+so a parameter-shared SB3 policy gets N transitions per simulation step.
+
+Usage:
+    env = SubprocVecEnv([lambda: RacetrackEnv(config=multi_agent_config(4)) for _ in range(n_envs)])
+    env = MultiAgentVecEnv(env, n_agents=4)     # n_envs * 4 slots
+'''
+
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnvWrapper
+from racetrack_env import RacetrackEnv
+
+# Info keys holding one value per agent in multi-agent mode
+AGENT_INFO_KEYS = (
+    "episode_reward",
+    "proximity_time",
+    "on_track_time",
+    "off_track_time",
+    "collision",
+)
+
+
+def multi_agent_config(n_agents: int) -> dict:
+    '''
+    Config overrides for RacetrackEnv with n_agents controlled vehicles,
+    wrapping the default observation and action in their multi-agent counterparts.
+    '''
+    config = RacetrackEnv.default_config()
+    return {
+        "controlled_vehicles": n_agents,
+        "observation": {"type": "MultiAgentObservation", "observation_config": config["observation"]},
+        "action": {"type": "MultiAgentAction", "action_config": config["action"]},
+    }
+
+
+class MultiAgentVecEnv(VecEnvWrapper):
+    '''
+    Flatten a VecEnv of multi-agent RacetrackEnvs into one slot per (env, agent).
+
+    Observations are stacked into (n_envs * n_agents, ...) arrays and the per-agent rewards are read
+    from info["agents_rewards"]. When an episode ends, the crashed agents are terminal and the others
+    are flagged with TimeLimit.truncated so their value is bootstrapped.
+    '''
+
+    def __init__(self, venv, n_agents: int):
+        self.n_agents = n_agents
+        self.n_sims = venv.num_envs
+        super().__init__(
+            venv,
+            observation_space=venv.observation_space.spaces[0],
+            action_space=venv.action_space.spaces[0],
+        )
+        self.num_envs = self.n_sims * n_agents
+
+    def _stack_obs(self, obs: tuple) -> np.ndarray:
+        # Tuple of n_agents arrays (n_sims, ...) -> (n_sims * n_agents, ...)
+        return np.stack(obs, axis=1).reshape(self.num_envs, *self.observation_space.shape)
+
+    def reset(self) -> np.ndarray:
+        return self._stack_obs(self.venv.reset())
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.venv.step_async(actions.reshape(self.n_sims, self.n_agents, *self.action_space.shape))
+
+    def step_wait(self):
+        obs, _, dones, infos = self.venv.step_wait()
+        rewards = np.stack([info["agents_rewards"] for info in infos]).reshape(self.num_envs).astype(np.float32)
+
+        agent_infos = []
+        for done, info in zip(dones, infos):
+            for agent in range(self.n_agents):
+                agent_info = {key: value for key, value in info.items() if key not in AGENT_INFO_KEYS}
+                for key in AGENT_INFO_KEYS:
+                    agent_info[key] = info[key][agent]
+                if done:
+                    agent_info["terminal_observation"] = info["terminal_observation"][agent]
+                    agent_info["TimeLimit.truncated"] = not info["agents_terminated"][agent]
+                agent_infos.append(agent_info)
+
+        return self._stack_obs(obs), rewards, np.repeat(dones, self.n_agents), agent_infos
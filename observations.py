@@ -0,0 +1,252 @@
+'''
+Custom observation types for RacetrackEnv.
+highway-env's observation_factory only knows its own types, so RacetrackEnv.define_spaces
+goes through the observation_factory below, which falls back to highway-env for the others.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+from gymnasium import spaces
+from highway_env import utils
+from highway_env.envs.common import observation as highway_observation
+from highway_env.envs.common.observation import ObservationType, OccupancyGridObservation
+from track_profile import TrackProfile
+
+
+class OnRoadCache:
+    '''
+    Bounded LRU of bit-packed on_road layers, keyed by quantized ego pose.
+    '''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.layers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        packed = self.layers.get(key)
+        if packed is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.layers.move_to_end(key)
+        return packed
+
+    def put(self, key, packed: np.ndarray) -> None:
+        self.layers[key] = packed
+        if len(self.layers) > self.max_entries:
+            self.layers.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.layers),
+            "bytes": sum(packed.nbytes for packed in self.layers.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedOccupancyGridObservation(OccupancyGridObservation):
+    '''
+    OccupancyGrid whose static on_road layer is served from a pose-quantized cache.
+
+    The tracks are static, so the on_road layer only depends on the track and the ego pose. The pose is
+    quantized to `position_step` meters and `heading_step` degrees, and the layer is computed once per
+    bucket (at the bucket center) with the same lane-waypoint rasterization as highway-env.
+    Vehicle features (presence) are still computed live every step.
+    '''
+
+    # Caches shared by all observations of the process with the same grid and quantization
+    caches = {}
+
+    def __init__(self, env, position_step: float = 0.5, heading_step: float = 2.0, cache_size: int = 20000, **kwargs):
+        super().__init__(env, **kwargs)
+        self.position_step = position_step
+        self.heading_step = np.deg2rad(heading_step)
+        cache_key = (
+            self.grid_size.tobytes(), self.grid_step.tobytes(), self.align_to_vehicle_axes, position_step, heading_step,
+        )
+        if cache_key not in self.caches:
+            self.caches[cache_key] = OnRoadCache(cache_size)
+        self.cache = self.caches[cache_key]
+
+    def fill_road_layer_by_lanes(self, layer_index: int, lane_perception_distance: float = 100) -> None:
+        vehicle = self.observer_vehicle
+        qx, qy = np.round(vehicle.position / self.position_step).astype(int)
+        qh = round(utils.wrap_to_pi(vehicle.heading) / self.heading_step) if self.align_to_vehicle_axes else 0
+        # Roads are rebuilt on every reset, but the geometry of a given track never changes
+        track = getattr(self.env, "track", id(self.env.road))
+        key = (track, qx, qy, qh)
+
+        packed = self.cache.get(key)
+        if packed is None:
+            position = np.array([qx, qy]) * self.position_step
+            layer = self.road_layer(position, qh * self.heading_step, lane_perception_distance)
+            packed = np.packbits(layer)
+            self.cache.put(key, packed)
+
+        layer = np.unpackbits(packed, count=self.grid[layer_index].size).reshape(self.grid.shape[-2:])
+        self.grid[layer_index][layer.astype(bool)] = 1
+
+    def road_layer(self, position: np.ndarray, heading: float, lane_perception_distance: float) -> np.ndarray:
+        '''
+        Boolean on_road layer seen from a given pose (vectorized fill_road_layer_by_lanes).
+        '''
+        lane_waypoints_spacing = np.amin(self.grid_step)
+        points = []
+        for _from, to_dict in self.env.road.network.graph.items():
+            for _to, lanes in to_dict.items():
+                for lane in lanes:
+                    origin, _ = lane.local_coordinates(position)
+                    waypoints = np.arange(
+                        origin - lane_perception_distance,
+                        origin + lane_perception_distance,
+                        lane_waypoints_spacing,
+                    ).clip(0, lane.length)
+                    points.extend(lane.position(waypoint, 0) for waypoint in waypoints)
+
+        points = np.array(points) - position
+        if self.align_to_vehicle_axes:
+            c, s = np.cos(heading), np.sin(heading)
+            points = points @ np.array([[c, s], [-s, c]]).T
+        cells = np.floor((points - self.grid_size[:, 0]) / self.grid_step).astype(int)
+        shape = np.array(self.grid.shape[-2:])
+        cells = cells[np.all((cells >= 0) & (cells < shape), axis=1)]
+
+        layer = np.zeros(self.grid.shape[-2:], dtype=bool)
+        layer[cells[:, 0], cells[:, 1]] = True
+        return layer
+
+
+class RacetrackCompactObservation(ObservationType):
+    '''
+    Compact vector observation built from the lane geometry instead of a grid:
+    - ego: lateral offset from the lane center, heading error (sin, cos), speed, on_road
+    - curvature of the lane at each `lookahead` distance
+    - the `vehicles_count` nearest vehicles: presence, relative arc-length along the track, lateral offset,
+      relative speed (measured along the ego's lane id around the lap, nearest first, zero padded)
+
+    Values are written into a preallocated float32 buffer.
+    '''
+
+    EGO_FEATURES = 5
+    VEHICLE_FEATURES = 4
+    CURVATURE_SCALE = 15        # Tightest radius of the tracks [m]
+    SPEED_SCALE = 20
+
+    def __init__(
+        self,
+        env,
+        vehicles_count: int = 4,
+        lookahead: list[float] = (0, 10, 20, 30, 40),
+        perception_distance: float = 50,
+        **kwargs,
+    ) -> None:
+        super().__init__(env)
+        self.vehicles_count = vehicles_count
+        self.lookahead = np.array(lookahead, dtype=float)
+        self.perception_distance = perception_distance
+        self.buffer = np.zeros(
+            self.EGO_FEATURES + len(self.lookahead) + self.VEHICLE_FEATURES * vehicles_count, dtype=np.float32
+        )
+
+    def space(self) -> spaces.Space:
+        return spaces.Box(shape=self.buffer.shape, low=-np.inf, high=np.inf, dtype=np.float32)
+
+    def track_profile(self) -> TrackProfile:
+        road = self.env.road
+        if getattr(road, "profile", None) is None:
+            road.profile = TrackProfile(road.network)       # Roads not built by the track builders
+        return road.profile
+
+    def observe(self) -> np.ndarray:
+        buffer = self.buffer
+        buffer.fill(0)
+        if not self.env.road:
+            return buffer.copy()
+
+        ego = self.observer_vehicle
+        lane = ego.lane
+        longitudinal, lateral = lane.local_coordinates(ego.position)
+        heading_error = utils.wrap_to_pi(ego.heading - lane.heading_at(longitudinal))
+        buffer[0] = lateral / lane.width_at(longitudinal)
+        buffer[1] = np.sin(heading_error)
+        buffer[2] = np.cos(heading_error)
+        buffer[3] = ego.speed / self.SPEED_SCALE
+        buffer[4] = ego.on_road
+
+        profile = self.track_profile()
+        offset = self.EGO_FEATURES
+        buffer[offset:offset + len(self.lookahead)] = self.CURVATURE_SCALE * profile.lookahead(
+            ego.lane_index, longitudinal, self.lookahead
+        )[:, 0]
+        offset += len(self.lookahead)
+
+        nearby = []
+        for vehicle in self.env.road.vehicles:
+            if vehicle is ego:
+                continue
+            distance = np.linalg.norm(vehicle.position - ego.position)
+            if distance < self.perception_distance:
+                nearby.append((distance, vehicle))
+        nearby.sort(key=lambda item: item[0])
+
+        # Other vehicles are projected on the ego's lane id of their own section: the ego lane frame
+        # is only valid on the ego's section, while the nearest vehicles are often on the next one
+        lane_id = ego.lane_index[2]
+        lap_length = profile.lap_length(lane_id)
+        ego_arc_length, ego_lateral = profile.frenet(ego.lane_index, ego.position)
+        for _, vehicle in nearby[:self.vehicles_count]:
+            arc_length, other_lateral = profile.frenet((*vehicle.lane_index[:2], lane_id), vehicle.position)
+            relative_arc_length = (arc_length - ego_arc_length + lap_length / 2) % lap_length - lap_length / 2
+            buffer[offset:offset + self.VEHICLE_FEATURES] = (
+                1,
+                relative_arc_length / self.perception_distance,
+                (other_lateral - ego_lateral) / self.perception_distance,
+                (vehicle.speed - ego.speed) / self.SPEED_SCALE,
+            )
+            offset += self.VEHICLE_FEATURES
+
+        # Copy: VecEnvs keep terminal observations while the env is reset
+        return buffer.copy()
+
+
+class MultiAgentObservation(highway_observation.MultiAgentObservation):
+    '''
+    highway-env MultiAgentObservation building its per-agent observations with the factory below.
+    '''
+
+    def __init__(self, env, observation_config: dict, **kwargs) -> None:
+        highway_observation.ObservationType.__init__(self, env)
+        self.observation_config = observation_config
+        self.agents_observation_types = []
+        for vehicle in self.env.controlled_vehicles:
+            obs_type = observation_factory(self.env, self.observation_config)
+            obs_type.observer_vehicle = vehicle
+            self.agents_observation_types.append(obs_type)
+
+
+def observation_factory(env, config: dict):
+    if config["type"] == "CachedOccupancyGrid":
+        return CachedOccupancyGridObservation(env, **config)
+    elif config["type"] == "RacetrackCompact":
+        return RacetrackCompactObservation(env, **config)
+    elif config["type"] == "MultiAgentObservation":
+        return MultiAgentObservation(env, **config)
+    else:
+        return highway_observation.observation_factory(env, config)
+
+
+def observation_cache_stats(observation_type) -> dict | None:
+    '''
+    on_road cache statistics of an observation (or of the first agent's in multi-agent mode).
+    '''
+    if isinstance(observation_type, MultiAgentObservation):
+        observation_type = observation_type.agents_observation_types[0]
+    if isinstance(observation_type, CachedOccupancyGridObservation):
+        return observation_type.cache.stats()
+    return None
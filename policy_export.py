@@ -0,0 +1,229 @@
+'''
+Torch-free policy runtime.
+
+export_policy converts the actor of a trained PPO / A2C / SAC / TD3 MlpPolicy into a .npz file: the weights
+of each linear layer, their activations and the action post-processing (clipping, or tanh squashing and
+rescaling to the action space). NumpyPolicy runs it with NumPy only, on buffers preallocated per batch size,
+and returns the deterministic action of model.predict(obs, deterministic=True) up to float32 rounding.
+The export records the hash of the model file it was made from: is_current tells whether it is still the
+actor of that file, so that a model retrained under the same name is exported again.
+
+Usage:
+    python policy_export.py export --algo PPO --model ppo_run      # models_v2/ppo_run.zip -> models_v2/exported/ppo_run.npz
+    python policy_export.py check --algo PPO --model ppo_run       # action error and latency against the SB3 model
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+current_folder = os.path.dirname(os.path.abspath(__file__))
+exported_folder = os.path.join(current_folder, "models_v2", "exported")
+
+ACTIVATIONS = {
+    "Tanh": lambda x: np.tanh(x, out=x),
+    "ReLU": lambda x: np.maximum(x, 0, out=x),
+    "Identity": lambda x: x,
+}
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _linear_layers(modules) -> list[tuple]:
+    '''
+    (weight, bias, activation) of a sequence of torch Linear and activation modules.
+    '''
+    layers = []
+    for module in modules:
+        name = type(module).__name__
+        if name == "Linear":
+            layers.append([module.weight.detach().cpu().numpy(), module.bias.detach().cpu().numpy(), "Identity"])
+        elif name in ACTIVATIONS and layers:
+            layers[-1][2] = name
+        else:
+            raise ValueError(f"Cannot export a {name} layer (MlpPolicy actors only)")
+    return [tuple(layer) for layer in layers]
+
+
+def export_policy(model, path: str, source_path: str | None = None) -> None:
+    '''
+    Export the deterministic actor of an SB3 model (Box actions, FlattenExtractor features) to `path` (.npz).
+    source_path: model file the model was loaded from, whose hash is stored in the metadata.
+    '''
+    from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
+    from stable_baselines3.common.torch_layers import FlattenExtractor
+
+    policy = model.policy
+    if isinstance(model, OffPolicyAlgorithm):
+        actor = policy.actor
+        if hasattr(actor, "latent_pi"):         # SAC: mu head on the latent, squashed by tanh
+            layers = _linear_layers(list(actor.latent_pi) + [actor.mu])
+            layers[-1] = (*layers[-1][:2], "Tanh")
+        else:                                   # TD3: mu ends with Tanh
+            layers = _linear_layers(actor.mu)
+        features_extractor = actor.features_extractor
+        postprocess = "unscale"
+    else:
+        layers = _linear_layers(list(policy.mlp_extractor.policy_net) + [policy.action_net])
+        features_extractor = policy.pi_features_extractor
+        postprocess = "unscale" if policy.squash_output else "clip"
+    if not isinstance(features_extractor, FlattenExtractor):
+        raise ValueError(f"Cannot export a {type(features_extractor).__name__} (MlpPolicy actors only)")
+
+    metadata = {
+        "algo": type(model).__name__,
+        "observation_shape": list(model.observation_space.shape),
+        "activations": [activation for _, _, activation in layers],
+        "postprocess": postprocess,
+        "source_hash": file_hash(source_path) if source_path else None,
+    }
+    arrays = {"low": model.action_space.low, "high": model.action_space.high}
+    for i, (weight, bias, _) in enumerate(layers):
+        arrays[f"weight_{i}"] = np.ascontiguousarray(weight.T, dtype=np.float32)    # x @ weight
+        arrays[f"bias_{i}"] = bias.astype(np.float32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(path, metadata=json.dumps(metadata), **arrays)
+
+
+class NumpyPolicy:
+    '''
+    Deterministic actor exported by export_policy, evaluated with NumPy on preallocated buffers.
+    '''
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.metadata = json.loads(str(data["metadata"]))
+            n_layers = len(self.metadata["activations"])
+            self.weights = [data[f"weight_{i}"] for i in range(n_layers)]
+            self.biases = [data[f"bias_{i}"] for i in range(n_layers)]
+            self.low, self.high = data["low"], data["high"]
+        self.observation_shape = tuple(self.metadata["observation_shape"])
+        self.activations = [ACTIVATIONS[name] for name in self.metadata["activations"]]
+        self.unscale = self.metadata["postprocess"] == "unscale"
+        self.batch_size = 0
+        self._allocate(1)
+
+    def _allocate(self, batch_size: int) -> None:
+        self.batch_size = batch_size
+        self.input = np.empty((batch_size, self.weights[0].shape[0]), dtype=np.float32)
+        self.buffers = [np.empty((batch_size, weight.shape[1]), dtype=np.float32) for weight in self.weights]
+
+    def forward(self, obs: np.ndarray) -> np.ndarray:
+        '''
+        Actions of a batch of observations (shape (batch, *observation_shape)).
+        The returned array is a buffer reused by the next call.
+        '''
+        batch_size = obs.shape[0]
+        if batch_size > self.batch_size:
+            self._allocate(batch_size)
+        x = self.input[:batch_size]
+        x[...] = obs.reshape(batch_size, -1)
+        for weight, bias, activation, buffer in zip(self.weights, self.biases, self.activations, self.buffers):
+            out = buffer[:batch_size]
+            np.dot(x, weight, out=out)
+            out += bias
+            x = activation(out)
+        if self.unscale:
+            x += 1
+            x *= 0.5 * (self.high - self.low)
+            x += self.low
+        else:
+            np.clip(x, self.low, self.high, out=x)
+        return x
+
+    def predict(self, observation: np.ndarray, state=None, episode_start=None, deterministic: bool = True):
+        '''
+        Same signature and output as SB3's model.predict (deterministic actions only).
+        '''
+        observation = np.asarray(observation, dtype=np.float32)
+        vectorized = observation.shape != self.observation_shape
+        obs = observation if vectorized else observation[None]
+        actions = self.forward(obs).copy()
+        return (actions if vectorized else actions[0]), None
+
+
+def exported_path(model_name: str) -> str:
+    return os.path.join(exported_folder, os.path.splitext(model_name)[0] + ".npz")
+
+
+def is_current(path: str, source_path: str) -> bool:
+    '''
+    Whether the policy exported to path exists and was exported from the current content of source_path.
+    '''
+    if not os.path.exists(path):
+        return False
+    with np.load(path) as data:
+        return json.loads(str(data["metadata"])).get("source_hash") == file_hash(source_path)
+
+
+def model_file(model_name: str) -> str:
+    from train_model import models_folder
+
+    path = os.path.join(models_folder, model_name)
+    return path if os.path.exists(path) else path + ".zip"
+
+
+def load_model(algo: str, model_name: str):
+    from stable_baselines3 import A2C, PPO, SAC, TD3
+
+    algos = {"PPO": PPO, "A2C": A2C, "SAC": SAC, "TD3": TD3}
+    return algos[algo].load(model_file(model_name), device="cpu")
+
+
+def check(algo: str, model_name: str, n_steps: int) -> None:
+    '''
+    Compare the exported policy with the SB3 model on observations of a random-action episode:
+    largest action difference and predict latency at batch size 1.
+    '''
+    from racetrack_env import RacetrackEnv
+
+    model = load_model(algo, model_name)
+    policy = NumpyPolicy(exported_path(model_name))
+    env = RacetrackEnv()
+    obs, _ = env.reset(seed=0)
+    observations = []
+    for _ in range(n_steps):
+        observations.append(obs)
+        obs, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if terminated or truncated:
+            obs, _ = env.reset()
+    env.close()
+
+    error = max(np.abs(model.predict(obs, deterministic=True)[0] - policy.predict(obs)[0]).max() for obs in observations)
+    timings = {}
+    for name, predict in (("sb3", lambda obs: model.predict(obs, deterministic=True)), ("numpy", policy.predict)):
+        start = time.perf_counter()
+        for obs in observations:
+            predict(obs)
+        timings[name] = (time.perf_counter() - start) / n_steps
+    print(f"Max action difference over {n_steps} observations: {error:.2e}")
+    print(f"predict latency: SB3 {timings['sb3'] * 1e6:.0f} us, NumPy {timings['numpy'] * 1e6:.0f} us "
+          f"({timings['sb3'] / timings['numpy']:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export SB3 actors to the NumPy policy runtime")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("export", "check"):
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("--algo", choices=["PPO", "A2C", "SAC", "TD3"], required=True)
+        command_parser.add_argument("--model", required=True, help="model name in models_v2/")
+        if command == "check":
+            command_parser.add_argument("--steps", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_policy(load_model(args.algo, args.model), exported_path(args.model), model_file(args.model))
+        print(f"Exported {args.model} to {exported_path(args.model)}")
+    else:
+        check(args.algo, args.model, args.steps)
@@ -0,0 +1,113 @@
+'''
+Low-overhead step-phase profiler for RacetrackEnv.
+Times the phases of a step (IDM behaviour, dynamics, collision checks, observation, rewards, ...)
+into fixed log-spaced latency histograms.
+
+Only one step every `sample_interval` steps is timed, so the cost on the other steps
+is a single counter increment.
+'''
+
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Histogram bin edges in seconds: 1us .. 10s, 8 bins per decade
+BIN_EDGES = np.logspace(-6, 1, 7 * 8 + 1)
+BIN_CENTERS = np.sqrt(BIN_EDGES[:-1] * BIN_EDGES[1:])
+
+PHASES = (
+    "step",
+    "behaviour",        # road.act(): IDM / controller decisions
+    "dynamics",         # vehicle.step(): kinematics integration
+    "collisions",       # vehicle.handle_collisions() pair checks
+    "observation",
+    "rewards",
+    "closest_vehicle",
+    "info",
+    "reset",
+    "make_road",
+)
+
+
+class StepProfiler:
+    def __init__(self, sample_interval: int = 100):
+        '''
+        -sample_interval: time one step out of every `sample_interval` steps (1 = every step)
+        '''
+        self.sample_interval = max(1, int(sample_interval))
+        self.counts = {phase: np.zeros(len(BIN_CENTERS), dtype=np.int64) for phase in PHASES}
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.steps = 0
+        self.active = False
+
+    def start_step(self) -> bool:
+        '''
+        Count a step and decide whether it is sampled.
+        '''
+        self.active = self.steps % self.sample_interval == 0
+        self.steps += 1
+        return self.active
+
+    def record(self, phase: str, seconds: float) -> None:
+        bin_index = min(max(np.searchsorted(BIN_EDGES, seconds) - 1, 0), len(BIN_CENTERS) - 1)
+        self.counts[phase][bin_index] += 1
+        self.totals[phase] += seconds
+
+    @contextmanager
+    def phase(self, phase: str):
+        '''
+        Time a block if the current step is sampled.
+        '''
+        if not self.active:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        '''
+        Picklable copy of the histograms, e.g. to send from a SubprocVecEnv worker.
+        '''
+        return {
+            "steps": self.steps,
+            "counts": {phase: counts.copy() for phase, counts in self.counts.items()},
+            "totals": dict(self.totals),
+        }
+
+
+def histogram_summary(counts: np.ndarray, total: float) -> dict:
+    '''
+    Mean and approximate percentiles (in milliseconds) of a latency histogram.
+    '''
+    n = counts.sum()
+    if n == 0:
+        return {}
+    cumulative = np.cumsum(counts) / n
+    summary = {"mean_ms": total / n * 1e3, "samples": int(n)}
+    for q in (50, 90, 99):
+        summary[f"p{q}_ms"] = float(BIN_CENTERS[np.searchsorted(cumulative, q / 100)] * 1e3)
+    return summary
+
+
+def process_stats() -> dict:
+    '''
+    Resident memory (bytes, None where unavailable) and CPU time (seconds, all threads) of the current process.
+    '''
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource     # Peak RSS: kilobytes on Linux, bytes on macOS
+            import sys
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        except ImportError:
+            pass
+    return {"pid": os.getpid(), "rss": rss, "cpu_time": time.process_time()}
@@ -1,12 +1,26 @@
 from highway_env.envs.common.abstract import AbstractEnv
 from highway_env.vehicle.behavior import IDMVehicle
-from track_builder import make_road
-from track_builder_large import make_road_large
-from highway_env.road.lane import CircularLane
+from highway_env.envs.common.action import action_factory
+from observations import observation_factory, observation_cache_stats
+from profiler import StepProfiler, process_stats
+from episode_metrics import EpisodeMetrics
+from vehicle_pool import VehiclePool
+from trajectory_history import TrajectoryViewer
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import time
 import numpy as np
 
 
 class RacetrackEnv(AbstractEnv):
+    profiler = None     # StepProfiler, created in _reset when profile_sample_interval > 0
+    _next_scene = None          # Future of the pre-warmed next episode (prewarm_resets)
+    _scene_rng = None
+    _scene_executor = None
+    _vehicle_pool = None        # VehiclePool reusing the vehicles of finished episodes
+    _lane_ids = None            # {vehicle: lane id} at step _lane_ids_key = (road, time)
+    _lane_ids_key = None
+
     @classmethod
     def default_config(cls) -> dict:
         '''
@@ -21,10 +35,16 @@ class RacetrackEnv(AbstractEnv):
         Custom configs:
         -vehicle_speed: Speed of the agent's vehicle
         -different_scenarios: If set to true every time the environment resets, the scenario configs change
+        -track: track used when different_scenarios is false ("small" or "large")
         -proximity_penalty: penalty for getting too close to front vehicle
         -lane_change_reward: reward for changing lane if too close to front vehicle
         -off_track_penalty: penalty for off-track actions
         -off_track_threshold: threshold for truncating the episode
+        -profile_sample_interval: time the phases of one step every N steps (0 disables the profiler)
+        -prewarm_resets: build the next episode's road and vehicles in a helper thread, so that the reset is a swap
+        -show_trajectories: record and draw the recent trajectory of every vehicle
+        -trajectory_length: trajectory samples kept per vehicle
+        -trajectory_stride: simulation frames between two trajectory samples
         '''      
         config = super().default_config()
         config.update(
@@ -44,6 +64,7 @@ class RacetrackEnv(AbstractEnv):
                     "target_speeds": [0, 5, 10],
                 },
                 "different_scenarios": True,
+                "track": "small",
                 "simulation_frequency": 15,
                 "policy_frequency": 10,
                 "duration": 60,
@@ -63,47 +84,66 @@ class RacetrackEnv(AbstractEnv):
                 "off_track_penalty": -7.5,
                 "off_track_threshold": 5,
                 "show_trajectories": False,
+                "trajectory_length": 60,
+                "trajectory_stride": 3,
+                "profile_sample_interval": 0,
+                "prewarm_resets": False,
             }
         )
         return config
     
+    def define_spaces(self) -> None:
+        """
+        Same as AbstractEnv.define_spaces, with the custom observation types of observations.py.
+        """
+        self.observation_type = observation_factory(self, self.config["observation"])
+        self.action_type = action_factory(self, self.config["action"])
+        self.observation_space = self.observation_type.space()
+        self.action_space = self.action_type.space()
+
+    @property
+    def multi_agent(self) -> bool:
+        return self.config["controlled_vehicles"] > 1
+
     def _init_metrics(self):
         """
         Initialize metrics for the episode.
+        Per-agent counters are the rows of self.metrics, indexed like self.controlled_vehicles.
         """
-        self.episode_reward = 0
-        self.episode_length = 0
-        self.proximity_time = 0
-        self.on_track_time = 0
-        self.off_track_time = 0
-        self.off_track = 0
-        self.collision = 0
+        n_agents = len(self.controlled_vehicles)
+        self.metrics = EpisodeMetrics(n_agents, 1 / self.config["policy_frequency"])
+        self.agents_rewards = np.zeros(n_agents)
 
-    def _update_metrics(self, reward, proximity_penalty: float):
+    def _vehicles_status(self) -> tuple[np.ndarray, np.ndarray]:
         """
-        Custom metrics function.
+        crashed and on_road flags of the controlled vehicles.
         """
-        self.episode_reward += reward
-        self.episode_length += 1 / self.config["policy_frequency"]
-
-        if self.vehicle.crashed:
-            self.collision += 1
-
-        if self.vehicle.on_road:
-            self.on_track_time += 1 / self.config["policy_frequency"]
-        else:
-            self.off_track_time += 1 / self.config["policy_frequency"]
-
-        if proximity_penalty != 0:
-            self.proximity_time += 1 / self.config["policy_frequency"]
+        crashed = np.array([vehicle.crashed for vehicle in self.controlled_vehicles])
+        on_road = np.array([vehicle.on_road for vehicle in self.controlled_vehicles])
+        return crashed, on_road
 
     def _reward(self, action: np.ndarray) -> float:
         rewards = self._rewards(action)
         total_reward = sum(rewards.values())
-        self._update_metrics(total_reward,rewards.get("proximity_penalty", 0),)
+        self.metrics.update(total_reward, rewards.get("proximity_penalty", 0), *self._vehicles_status())
+        if self.multi_agent:
+            # Per-agent rewards are reported in info["agents_rewards"], the env reward is their mean
+            self.agents_rewards = total_reward
+            return float(np.mean(total_reward))
         return total_reward
 
-    def _rewards(self, action: np.ndarray) -> dict[str, float]:
+    def _rewards(self, action) -> dict:
+        """
+        Reward terms of the first agent, or of every agent as arrays in multi-agent mode.
+        """
+        _, on_road = self._vehicles_status()
+        off_track = self.metrics.step_off_track(on_road)       # Seconds each car is off_track
+        if not self.multi_agent:
+            return self._agent_rewards(0, action, off_track[0])
+        agents = [self._agent_rewards(i, agent_action, off_track[i]) for i, agent_action in enumerate(action)]
+        return {key: np.array([rewards[key] for rewards in agents]) for key in agents[0]}
+
+    def _agent_rewards(self, agent: int, action: np.ndarray, off_track: float) -> dict[str, float]:
         '''
         Custom rewards function.
         Applies reward for lane changing when collision is eminent.
@@ -111,36 +151,32 @@ class RacetrackEnv(AbstractEnv):
         Off track penalty.
         Speed up / slow down filter (hard coded in _cruise_control).
         '''
-        _, lateral = self.vehicle.lane.local_coordinates(self.vehicle.position)
-        front_vehicle, distance_to_front = self._get_closest_vehicle_in_lane(self.vehicle)
+        vehicle = self.controlled_vehicles[agent]
+        _, lateral = vehicle.lane.local_coordinates(vehicle.position)
+        with self._profile("closest_vehicle"):
+            front_vehicle, distance_to_front = self._get_closest_vehicle_in_lane(vehicle)
         lane_change_reward = 0
         proximity_penalty = 0
-        off_track_penalty = 0
+        off_track_penalty = off_track       # 0 while on the track
 
         lateral_action = True if abs(action[0]) >= 0.25 else False
 
         #self._cruise_control(front_vehicle, distance_to_front)
 
-        if front_vehicle and self.vehicle.lane_index == front_vehicle.lane_index:
+        if front_vehicle:     # Always in the vehicle's lane
             if distance_to_front <= 15:
                 # "Semi Filter" of lane changing
                 if lateral_action == True:  # Reward only for lateral moves
                     lane_change_reward = 5  # Reward lane change
                 proximity_penalty = 10 / (1 + distance_to_front)
-        
-        if not self.vehicle.on_road:
-            self.off_track += 1 / self.config["policy_frequency"]       # Seconds the car is off_track
-            off_track_penalty = self.off_track
-        else:
-            self.off_track = 0
 
         return {
             "lane_centering_reward": (1 / (1 + self.config["lane_centering_cost"] * lateral**2)) * self.config["lane_centering_reward"],
             "action_reward": np.linalg.norm(action) * self.config["action_reward"],
-            "on_road_reward": self.vehicle.on_road * self.config["on_road_reward"],
+            "on_road_reward": vehicle.on_road * self.config["on_road_reward"],
             "proximity_penalty": proximity_penalty * self.config["proximity_penalty"],
             "lane_change_reward": lane_change_reward * self.config["lane_change_reward"],
-            "collision_reward": self.vehicle.crashed * self.config["collision_reward"],
+            "collision_reward": vehicle.crashed * self.config["collision_reward"],
             "off_track_penalty": off_track_penalty * self.config["off_track_penalty"],
         }
     
@@ -163,47 +199,60 @@ class RacetrackEnv(AbstractEnv):
             print(f"\rSpeed: {self.vehicle.speed:.2f} CONSTANT", end="")
     '''
         
+    def _vehicle_lane_ids(self) -> dict:
+        """
+        Interned lane id (road.lanes) of every vehicle of the road, computed once per simulation step.
+        """
+        key = (self.road, self.time)
+        if self._lane_ids_key != key:
+            index_of = self.road.lanes.index_of
+            self._lane_ids = {vehicle: index_of[vehicle.lane_index] for vehicle in self.road.vehicles}
+            self._lane_ids_key = key
+        return self._lane_ids
+
     def _get_closest_vehicle_in_lane(self, vehicle):
         """
         Get the distance to the closest vehicle in the same lane, ignoring negative distances.
+        Vehicles are matched on their interned lane ids rather than their lane index tuples.
         """
-        lane_index = vehicle.lane_index
-        vehicles_in_lane = [
-            v for v in self.road.vehicles
-            if v.lane_index == lane_index and v != vehicle and v.on_road
-        ]
-
-        if not vehicles_in_lane:
-            return None, float("inf")
+        lanes = self.road.lanes
+        lane_ids = self._vehicle_lane_ids()
+        lane_id = lane_ids[vehicle]
+        lane = lanes.lanes[lane_id]
+        circular = lanes.circular[lane_id]
 
         closest_vehicle = None
         min_distance = float("inf")
-
-        for other_vehicle in vehicles_in_lane:
-            raw_distance = self._longitudinal_distance(vehicle, other_vehicle)
+        for other_vehicle, other_lane_id in lane_ids.items():
+            if other_lane_id != lane_id or other_vehicle is vehicle or not other_vehicle.on_road:
+                continue
+            raw_distance = self._longitudinal_distance(vehicle, other_vehicle, lane, circular)
             if raw_distance >= 0 and raw_distance < min_distance:
                 closest_vehicle = other_vehicle
                 min_distance = raw_distance
 
         return closest_vehicle, min_distance
 
-    def _longitudinal_distance(self, vehicle1, vehicle2):
+    def _longitudinal_distance(self, vehicle1, vehicle2, lane=None, circular=None):
         """
         Calculate the longitudinal distance between two vehicles along the same lane.
         Handles wrapping effects for circular and straight lanes.
+        lane / circular: the lane both vehicles are known to be on (looked up and checked otherwise).
         """
-        lane = self.road.network.get_lane(vehicle1.lane_index)
-        
-        # Ensure both vehicles are on the same lane
-        if vehicle1.lane_index != vehicle2.lane_index:
-            return float("inf")
+        if lane is None:
+            lanes = self.road.lanes
+            lane_id = lanes.index_of[vehicle1.lane_index]
+            # Ensure both vehicles are on the same lane
+            if lanes.index_of.get(vehicle2.lane_index) != lane_id:
+                return float("inf")
+            lane, circular = lanes.lanes[lane_id], lanes.circular[lane_id]
 
         pos1 = lane.local_coordinates(vehicle1.position)[0]
         pos2 = lane.local_coordinates(vehicle2.position)[0]
         lane_length = lane.length
         raw_distance = pos2 - pos1
 
-        if isinstance(lane, CircularLane):
+        if circular:
             if raw_distance > lane_length / 2:
                 raw_distance -= lane_length
             elif raw_distance < -lane_length / 2:
@@ -216,92 +265,283 @@ class RacetrackEnv(AbstractEnv):
         Return additional metrics in the info dictionary.
         """
         info = super()._info(obs, action)
+        # Per-agent metrics: scalars for a single agent, arrays in multi-agent mode
+        agent_metric = (lambda values: values.copy()) if self.multi_agent else (lambda values: values[0])
         info.update({
-            "episode_reward": self.episode_reward,
-            "episode_length": self.episode_length,
-            "proximity_time": self.proximity_time,
-            "on_track_time": self.on_track_time,
-            "off_track_time": self.off_track_time,
-            "collision": self.collision,
+            "episode_reward": agent_metric(self.metrics.episode_reward),
+            "episode_length": self.metrics.episode_length[0],
+            "proximity_time": agent_metric(self.metrics.proximity_time),
+            "on_track_time": agent_metric(self.metrics.on_track_time),
+            "off_track_time": agent_metric(self.metrics.off_track_time),
+            "collision": agent_metric(self.metrics.collision),
+            "scenario": {
+                "track": self.track,
+                "other_vehicles": int(self.config["other_vehicles"]),
+                "vehicle_speed": int(self.config["vehicle_speed"]),
+            },
         })
+        if self.multi_agent:
+            info["agents_rewards"] = self.agents_rewards
+            info["agents_terminated"] = self.metrics.terminated().copy()
         return info
 
+    def _profile(self, phase: str):
+        """
+        Time a block of the current step if the profiler is enabled and the step is sampled.
+        """
+        return self.profiler.phase(phase) if self.profiler else nullcontext()
+
+    def profile_snapshot(self) -> dict | None:
+        """
+        Latency histograms of this env (called through VecEnv.env_method by the training callback).
+        """
+        return self.profiler.snapshot() if self.profiler else None
+
+    def observation_cache_stats(self) -> dict | None:
+        """
+        Hit rate and size of the on_road cache (CachedOccupancyGrid observation only).
+        """
+        return observation_cache_stats(self.observation_type)
+
+    def process_stats(self) -> dict:
+        """
+        Memory and CPU time of the worker process running this env (called by the telemetry callback).
+        """
+        return process_stats()
+
+    def monitor_frame(self, size: int = 160) -> np.ndarray:
+        """
+        Headless frame (size, size, 3) of the whole track and its vehicles (called by the mosaic monitor callback).
+        """
+        from monitor import track_renderer      # pygame drawing, loaded on first use
+        return track_renderer(self.track, self.road.lanes.lanes, size).render(self.road.vehicles)
+
+    def step(self, action):
+        if self.multi_agent and not isinstance(action, tuple):
+            action = tuple(action)      # Batched (n_agents, ...) array from a VecEnv
+        if self.profiler is None or not self.profiler.start_step():
+            return super().step(action)
+
+        # Sampled step: same sequence as AbstractEnv.step, with every phase timed
+        start = time.perf_counter()
+        self.time += 1 / self.config["policy_frequency"]
+        self._simulate(action)
+        with self._profile("observation"):
+            obs = self.observation_type.observe()
+        with self._profile("rewards"):
+            reward = self._reward(action)
+        terminated = self._is_terminated()
+        truncated = self._is_truncated()
+        with self._profile("info"):
+            info = self._info(obs, action)
+        if self.render_mode == "human":
+            self.render()
+        self.profiler.record("step", time.perf_counter() - start)
+        return obs, reward, terminated, truncated, info
+
+    def _simulate(self, action=None) -> None:
+        if self.profiler is None or not self.profiler.active:
+            return super()._simulate(action)
+
+        # Sampled step: split road.act() / road.step() into behaviour, dynamics and collisions
+        frames = int(self.config["simulation_frequency"] // self.config["policy_frequency"])
+        dt = 1 / self.config["simulation_frequency"]
+        for frame in range(frames):
+            if action is not None and not self.config["manual_control"] and self.steps % frames == 0:
+                self.action_type.act(action)
+            with self._profile("behaviour"):
+                self.road.act()
+            with self._profile("dynamics"):
+                for vehicle in self.road.vehicles:
+                    vehicle.step(dt)
+            with self._profile("collisions"):
+                for i, vehicle in enumerate(self.road.vehicles):
+                    for other in self.road.vehicles[i + 1:]:
+                        vehicle.handle_collisions(other, dt)
+                    for other in self.road.objects:
+                        vehicle.handle_collisions(other, dt)
+            self.road.record_trajectories()
+            self.steps += 1
+            if frame < frames - 1:
+                self._automatic_rendering()
+        self.enable_auto_render = False
+
+    def render(self):
+        if self.viewer is None and self.render_mode is not None:
+            self.viewer = TrajectoryViewer(self)        # Draws the trajectories of show_trajectories
+        return super().render()
+
     def _is_terminated(self) -> bool:
-        if self.vehicle.crashed == True:
-            return True
-        return False
+        return bool(self.metrics.terminated().any())
 
     def _is_truncated(self) -> bool:
-        if self.time >= self.config["duration"] or self.off_track_time >= self.config["off_track_threshold"]:
-            return True
-        return False
+        return bool(self.metrics.truncated(self.time, self.config["duration"], self.config["off_track_threshold"]).any())
 
     def _is_terminal(self) -> bool:
-        return self._is_terminated() or self._is_truncated()
+        truncated = self.metrics.truncated(self.time, self.config["duration"], self.config["off_track_threshold"])
+        return bool((self.metrics.terminated() | truncated).any())
 
     def _reset(self) -> None:
-        if self.config["different_scenarios"]:
-            self.config["vehicle_speed"] = self.np_random.integers(14, 20)       # Random speed
-            track = self.np_random.integers(1,1000)      # Random track
-            if track % 2 == 0:
-                self.config["other_vehicles"] = self.np_random.integers(1, 5)
-                self._make_road()
-                self.config["duration"] = 60
-            else:
-                self.config["other_vehicles"] = self.np_random.integers(10, 15)
-                self._make_road_large()
-                self.config["duration"] = 120       # More time for bigger track
-        else: self._make_road()
-        
-        self._make_vehicles()
+        interval = self.config["profile_sample_interval"]
+        if not interval:
+            self.profiler = None
+        elif self.profiler is None or self.profiler.sample_interval != interval:
+            self.profiler = StepProfiler(interval)
+        if self.profiler:
+            self.profiler.active = False
+
+        start = time.perf_counter()
+        self._reset_scene()
+        if self.profiler:
+            self.profiler.record("reset", time.perf_counter() - start)
+
+    def reset(self, *, seed=None, options=None):
+        if seed is not None or options:
+            self._discard_next_scene()      # The pre-warmed scene was drawn from the previous seed / config
+        return super().reset(seed=seed, options=options)
+
+    def close(self) -> None:
+        self._discard_next_scene()
+        if self._scene_executor is not None:
+            self._scene_executor.shutdown()
+            self._scene_executor = None
+        super().close()
+
+    def _reset_scene(self) -> None:
+        if self._vehicle_pool is None:
+            self._vehicle_pool = VehiclePool()
+        self._release_road()
+        if self._next_scene is not None:
+            scene = self._next_scene.result()
+            self._next_scene = None
+        else:
+            scene = self._build_scene(self.np_random, self.config, self.profiler)
+        self._apply_scene(scene)
         self._init_metrics()
 
+        if self.config["prewarm_resets"]:
+            # Build the next episode's road and vehicles in a helper thread, mostly while the
+            # worker process waits for the next action
+            if self._scene_rng is None:
+                self._scene_rng = np.random.default_rng(self.np_random.integers(2**63))
+            if self._scene_executor is None:
+                self._scene_executor = ThreadPoolExecutor(max_workers=1)
+            self._next_scene = self._scene_executor.submit(self._build_scene, self._scene_rng, dict(self.config))
+
+    def _discard_next_scene(self) -> None:
+        if self._next_scene is not None:
+            self._vehicle_pool.release_road(self._next_scene.result()["road"])
+            self._next_scene = None
+        self._scene_rng = None
+
+    def _release_road(self) -> None:
+        """
+        Give the vehicles of the current road back to the pool (no-op once released).
+        """
+        if self.road is not None:
+            self._vehicle_pool.release_road(self.road)
 
-    def _make_road(self) -> None:
-        self.road = make_road(self.np_random, show_trajectories=self.config["show_trajectories"])
+    def _build_scene(self, rng, config: dict, profiler: StepProfiler | None = None) -> dict:
+        """
+        Draw the scenario of an episode and build its road and vehicles (taken from the vehicle pool).
+        Does not modify the env, so that it can run in the pre-warm thread.
+        """
+        track = "large" if config["track"] == "large" else "small"
+        different_scenarios = config["different_scenarios"]
+        config = {key: config[key] for key in (
+            "vehicle_speed", "other_vehicles", "duration", "controlled_vehicles",
+            "show_trajectories", "trajectory_length", "trajectory_stride",
+        )}
+        if different_scenarios:
+            config["vehicle_speed"] = rng.integers(14, 20)       # Random speed
+            track = "small" if rng.integers(1,1000) % 2 == 0 else "large"       # Random track
+            if track == "small":
+                config["other_vehicles"] = rng.integers(1, 5)
+                config["duration"] = 60
+            else:
+                config["other_vehicles"] = rng.integers(10, 15)
+                config["duration"] = 120       # More time for bigger track
+
+        start = time.perf_counter()
+        road = self._make_road(rng, config) if track == "small" else self._make_road_large(rng, config)
+        if profiler:
+            profiler.record("make_road", time.perf_counter() - start)
+        controlled_vehicles = self._make_vehicles(road, rng, config)
+        return {
+            "track": track,
+            "road": road,
+            "controlled_vehicles": controlled_vehicles,
+            "config": {key: config[key] for key in ("vehicle_speed", "other_vehicles", "duration")},
+        }
+
+    def _apply_scene(self, scene: dict) -> None:
+        self.config.update(scene["config"])
+        self.track = scene["track"]
+        self.road = scene["road"]
+        self.road.np_random = self.np_random       # Pre-warmed roads were built with the pre-warm generator
+        self.controlled_vehicles = scene["controlled_vehicles"]
+        self._lane_ids_key = None
+
+    def _make_road(self, rng, config: dict):
+        from track_builder import make_road     # Track builders are loaded on first use
+        return make_road(rng, config["show_trajectories"], config["trajectory_length"], config["trajectory_stride"])
     
-    def _make_road_large(self) -> None:
-        self.road = make_road_large(self.np_random, show_trajectories=self.config["show_trajectories"])
-
-    def _make_vehicles(self) -> None:
-        rng = self.np_random
-
-        self.controlled_vehicles = []
-        for i in range(self.config["controlled_vehicles"]):
-            lane_index = (
-                ("a", "b", rng.integers(0, 2))
-                if i == 0
-                else self.road.network.random_lane_index(rng)
-            )
-            controlled_vehicle = self.action_type.vehicle_class.make_on_lane(
-                self.road, lane_index, speed=self.config["vehicle_speed"], longitudinal=rng.uniform(20, 50)
-            )
-            self.controlled_vehicles.append(controlled_vehicle)
-            self.road.vehicles.append(controlled_vehicle)
+    def _make_road_large(self, rng, config: dict):
+        from track_builder_large import make_road_large
+        return make_road_large(rng, config["show_trajectories"], config["trajectory_length"], config["trajectory_stride"])
+
+    def _make_vehicles(self, road, rng, config: dict) -> list:
+        """
+        Add the controlled and IDM vehicles to the road, return the controlled vehicles.
+        """
+        pool = self._vehicle_pool
+        controlled_vehicles = []
+        for i in range(config["controlled_vehicles"]):
+            attempts = 10       # Resample agents spawned on top of an already placed agent
+            for attempt in range(attempts):
+                lane_index = (
+                    ("a", "b", rng.integers(0, 2))
+                    if i == 0
+                    else road.network.random_lane_index(rng)
+                )
+                controlled_vehicle = pool.make_on_lane(
+                    self.action_type.vehicle_class, road, lane_index, speed=config["vehicle_speed"], longitudinal=rng.uniform(20, 50)
+                )
+                if all(np.linalg.norm(controlled_vehicle.position - v.position) >= 10 for v in controlled_vehicles):
+                    break
+                if attempt < attempts - 1:      # The last candidate is kept even if too close
+                    pool.release([controlled_vehicle])
+            controlled_vehicles.append(controlled_vehicle)
+            road.vehicles.append(controlled_vehicle)
 
-        if self.config["other_vehicles"] > 0:
-            vehicle = IDMVehicle.make_on_lane(
-                self.road,
+        if config["other_vehicles"] > 0:
+            vehicle = pool.make_on_lane(
+                IDMVehicle,
+                road,
                 ("b", "c", lane_index[-1]),
                 longitudinal=rng.uniform(
-                    low=0, high=self.road.network.get_lane(("b", "c", 0)).length
+                    low=0, high=road.network.get_lane(("b", "c", 0)).length
                 ),
                 speed=6 + rng.uniform(low= -1, high=1),
             )
-            self.road.vehicles.append(vehicle)
+            road.vehicles.append(vehicle)
 
-            for i in range(self.config["other_vehicles"]):
-                random_lane_index = self.road.network.random_lane_index(rng)
-                vehicle = IDMVehicle.make_on_lane(
-                    self.road,
+            for i in range(config["other_vehicles"]):
+                random_lane_index = road.network.random_lane_index(rng)
+                vehicle = pool.make_on_lane(
+                    IDMVehicle,
+                    road,
                     random_lane_index,
                     longitudinal=rng.uniform(
-                        low=0, high=self.road.network.get_lane(random_lane_index).length
+                        low=0, high=road.network.get_lane(random_lane_index).length
                     ),
                     speed=6 + rng.uniform(low= -1, high=1),
                 )
-                for v in self.road.vehicles:
+                for v in road.vehicles:
                     if np.linalg.norm(vehicle.position - v.position) < 20:
+                        pool.release([vehicle])
                         break
                 else:
-                    self.road.vehicles.append(vehicle)
+                    road.vehicles.append(vehicle)
+
+        return controlled_vehicles
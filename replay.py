@@ -0,0 +1,139 @@
+'''
+Seeded, bit-exact episode replay.
+
+An episode is fully determined by (env config, reset seed, action sequence): reset(seed=...) seeds the
+scenario draw, the track and the IDM vehicles. Replaying it produces a SHA-256 checksum over every
+observation, reward and termination flag, so an optimized simulator, observation or reward path can be
+checked against the original one bit for bit before it is used for training.
+
+Usage:
+    python replay.py record --episodes 5 --output benchmarks/replays.json   # seeded random-action episodes
+    python replay.py check --input benchmarks/replays.json                  # exit 1 on any mismatch
+
+Checksums depend on the NumPy / highway-env versions and the machine: record references where they are checked.
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+from racetrack_env import RacetrackEnv
+
+current_folder = os.path.dirname(os.path.abspath(__file__))
+default_replays = os.path.join(current_folder, "benchmarks", "replays.json")
+
+
+class EpisodeChecksum:
+    '''
+    Running SHA-256 over the observations, rewards and termination flags of an episode.
+    '''
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def update(self, obs, reward=None, terminated=False, truncated=False) -> None:
+        self.hash.update(np.ascontiguousarray(obs).tobytes())
+        if reward is not None:
+            self.hash.update(np.float64(reward).tobytes())
+            self.hash.update(bytes([terminated, truncated]))
+
+    def hexdigest(self) -> str:
+        return self.hash.hexdigest()
+
+
+def run_episode(env, seed: int, actions=None, policy=None, max_steps: int = 1000) -> dict:
+    '''
+    Run one episode from reset(seed=seed), with the given actions or the actions of policy(obs).
+    Returns the episode record: seed, actions, length, total reward and checksum.
+    '''
+    obs, _ = env.reset(seed=seed)
+    checksum = EpisodeChecksum()
+    checksum.update(obs)
+    taken = []
+    total_reward = 0.0
+    terminated = truncated = False
+    n_steps = len(actions) if actions is not None else max_steps
+    for step in range(n_steps):
+        action = np.asarray(actions[step] if actions is not None else policy(obs), dtype=np.float32)
+        obs, reward, terminated, truncated, _ = env.step(action)
+        checksum.update(obs, reward, terminated, truncated)
+        taken.append(action.tolist())
+        total_reward += reward
+        if terminated or truncated:
+            break
+    return {
+        "seed": seed,
+        "actions": taken,
+        "length": len(taken),
+        "total_reward": float(total_reward),
+        "terminated": bool(terminated),
+        "truncated": bool(truncated),
+        "checksum": checksum.hexdigest(),
+    }
+
+
+def random_policy(action_space, seed: int):
+    rng = np.random.default_rng(seed)
+    return lambda obs: rng.uniform(action_space.low, action_space.high).astype(np.float32)
+
+
+def record(config: dict, seeds: list[int], max_steps: int) -> list[dict]:
+    env = RacetrackEnv(config=config)
+    episodes = [run_episode(env, seed, policy=random_policy(env.action_space, seed), max_steps=max_steps) for seed in seeds]
+    env.close()
+    return episodes
+
+
+def check(replays: dict, config: dict | None = None) -> list[str]:
+    '''
+    Replay every recorded episode (with `config` instead of the recorded one if given)
+    and return a description of each checksum mismatch.
+    '''
+    env = RacetrackEnv(config=config if config is not None else replays["config"])
+    mismatches = []
+    for episode in replays["episodes"]:
+        result = run_episode(env, episode["seed"], actions=episode["actions"])
+        status = "ok" if result["checksum"] == episode["checksum"] else "MISMATCH"
+        print(f"{status:>8}  seed {episode['seed']}: {result['length']} steps, reward {result['total_reward']:.4f}"
+              f" (recorded {episode['length']} steps, reward {episode['total_reward']:.4f})", file=sys.stderr)
+        if status != "ok":
+            mismatches.append(f"seed {episode['seed']}")
+    env.close()
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeded bit-exact episode replay")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="record seeded random-action episodes")
+    record_parser.add_argument("--episodes", type=int, default=5)
+    record_parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    record_parser.add_argument("--max-steps", type=int, default=300)
+    record_parser.add_argument("--config", default="{}", help="RacetrackEnv config overrides (JSON)")
+    record_parser.add_argument("--output", default=default_replays)
+
+    check_parser = subparsers.add_parser("check", help="replay recorded episodes and compare checksums")
+    check_parser.add_argument("--input", default=default_replays)
+    check_parser.add_argument("--config", help="replay with this config (JSON) instead of the recorded one")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        config = json.loads(args.config)
+        seeds = list(range(args.seed, args.seed + args.episodes))
+        replays = {"config": config, "episodes": record(config, seeds, args.max_steps)}
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(replays, f)
+        print(f"{len(seeds)} episodes recorded to {args.output}", file=sys.stderr)
+    else:
+        with open(args.input) as f:
+            replays = json.load(f)
+        mismatches = check(replays, json.loads(args.config) if args.config else None)
+        if mismatches:
+            print(f"{len(mismatches)} episode(s) do not replay bit-exactly: {', '.join(mismatches)}", file=sys.stderr)
+            sys.exit(1)
+        print(f"All {len(replays['episodes'])} episodes replay bit-exactly", file=sys.stderr)
@@ -0,0 +1,147 @@
+'''
+Compressed replay buffer for SAC / TD3 on binary occupancy-grid observations.
+
+The default SB3 ReplayBuffer stores every float32 2x40x40 observation twice (obs and next_obs),
+~25 KB per transition. Both OccupancyGrid channels (presence, on_road) are binary, so PackedReplayBuffer
+stores each observation once, bit-packed (400 bytes):
+- next_obs of a transition is the obs stored at the following index of the same env
+- the terminal observation of a finished episode (the next index holds the reset observation) is kept
+  in a side storage, so truncated episodes still bootstrap from the right observation
+'''
+
+from typing import Any
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+from stable_baselines3.common.vec_env import VecNormalize
+
+# OccupancyGrid features with values in {0, 1}
+BINARY_FEATURES = {"presence", "on_road"}
+
+
+def is_binary_observation(observation_config: dict) -> bool:
+    '''
+    Whether an observation config (RacetrackEnv "observation") only produces values in {0, 1}:
+    an (optionally cached, or per agent) OccupancyGrid of binary features, not rendered as an image.
+    '''
+    from highway_env.envs.common.observation import OccupancyGridObservation
+
+    if observation_config["type"] == "MultiAgentObservation":
+        observation_config = observation_config["observation_config"]
+    return (
+        observation_config["type"] in ("OccupancyGrid", "CachedOccupancyGrid")
+        and set(observation_config.get("features", OccupancyGridObservation.FEATURES)) <= BINARY_FEATURES
+        and not observation_config.get("as_image", False)
+    )
+
+
+class PackedReplayBuffer(ReplayBuffer):
+    '''
+    Drop-in ReplayBuffer (replay_buffer_class=PackedReplayBuffer) for Box observations with values in {0, 1}.
+    Same parameters as ReplayBuffer, optimize_memory_usage is implied.
+    '''
+
+    def __init__(
+        self,
+        buffer_size: int,
+        observation_space: spaces.Space,
+        action_space: spaces.Space,
+        device="auto",
+        n_envs: int = 1,
+        optimize_memory_usage: bool = False,
+        handle_timeout_termination: bool = True,
+    ):
+        assert isinstance(observation_space, spaces.Box), "PackedReplayBuffer only supports Box observations"
+        # ReplayBuffer.__init__ would allocate the float observation arrays
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        self.optimize_memory_usage = True
+        self.handle_timeout_termination = handle_timeout_termination
+
+        self.obs_bits = int(np.prod(self.obs_shape))
+        self.observations = np.zeros((self.buffer_size, self.n_envs, (self.obs_bits + 7) // 8), dtype=np.uint8)
+        self.terminal_observations = {}     # (index, env) -> packed terminal observation
+        self.actions = np.zeros(
+            (self.buffer_size, self.n_envs, self.action_dim), dtype=self._maybe_cast_dtype(action_space.dtype)
+        )
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.timeouts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        '''
+        Memory used by the stored transitions.
+        '''
+        arrays = (self.observations, self.actions, self.rewards, self.dones, self.timeouts)
+        return sum(array.nbytes for array in arrays) + sum(
+            packed.nbytes for packed in self.terminal_observations.values()
+        )
+
+    def pack(self, obs: np.ndarray) -> np.ndarray:
+        obs = np.asarray(obs).reshape(len(obs), -1)
+        if np.any((obs != 0) & (obs != 1)):
+            raise ValueError("PackedReplayBuffer only stores binary observations")
+        return np.packbits(obs.astype(bool), axis=-1)
+
+    def unpack(self, packed: np.ndarray) -> np.ndarray:
+        obs = np.unpackbits(packed, axis=-1, count=self.obs_bits)
+        return obs.reshape(len(packed), *self.obs_shape).astype(self.observation_space.dtype)
+
+    def add(
+        self,
+        obs: np.ndarray,
+        next_obs: np.ndarray,
+        action: np.ndarray,
+        reward: np.ndarray,
+        done: np.ndarray,
+        infos: list[dict[str, Any]],
+    ) -> None:
+        done = np.asarray(done, dtype=bool)
+        next_pos = (self.pos + 1) % self.buffer_size
+        packed_next = self.pack(next_obs)
+
+        for env in range(self.n_envs):
+            self.terminal_observations.pop((self.pos, env), None)
+            if done[env]:
+                self.terminal_observations[(self.pos, env)] = packed_next[env]
+        self.observations[self.pos] = self.pack(obs)
+        # Until the next add overwrites it with the reset observation, the next index of a finished env
+        # holds the terminal observation (like the following observation for the other envs)
+        self.observations[next_pos] = packed_next
+
+        self.actions[self.pos] = np.array(action).reshape((self.n_envs, self.action_dim))
+        self.rewards[self.pos] = np.array(reward)
+        self.dones[self.pos] = done
+        if self.handle_timeout_termination:
+            self.timeouts[self.pos] = np.array([info.get("TimeLimit.truncated", False) for info in infos])
+
+        self.pos = next_pos
+        if self.pos == 0:
+            self.full = True
+
+    def sample(self, batch_size: int, env: VecNormalize | None = None) -> ReplayBufferSamples:
+        # Index self.pos holds the next observation of the latest transition, not a valid transition
+        if self.full:
+            batch_inds = (np.random.randint(1, self.buffer_size, size=batch_size) + self.pos) % self.buffer_size
+        else:
+            batch_inds = np.random.randint(0, self.pos, size=batch_size)
+        return self._get_samples(batch_inds, env=env)
+
+    def _get_samples(self, batch_inds: np.ndarray, env: VecNormalize | None = None) -> ReplayBufferSamples:
+        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        packed_next = self.observations[(batch_inds + 1) % self.buffer_size, env_indices]
+        for row in np.flatnonzero(self.dones[batch_inds, env_indices]):
+            packed_next[row] = self.terminal_observations[(batch_inds[row], env_indices[row])]
+
+        data = (
+            self._normalize_obs(self.unpack(self.observations[batch_inds, env_indices]), env),
+            self.actions[batch_inds, env_indices, :],
+            self._normalize_obs(self.unpack(packed_next), env),
+            # Only use dones that are not due to timeouts
+            (self.dones[batch_inds, env_indices] * (1 - self.timeouts[batch_inds, env_indices])).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
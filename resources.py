@@ -0,0 +1,175 @@
+'''
+CPU resource manager for training processes.
+
+Env workers and the learner are pinned to disjoint core sets, and every process gets a BLAS / torch thread
+budget matching its cores, instead of each of them starting one thread per core of the machine.
+calibrate_n_envs picks the number of env workers by timing a RacetrackEnv step and a learner update and
+splitting the cores so that collection keeps up with the learner.
+
+Core pinning needs os.sched_setaffinity (Linux); elsewhere only the thread budgets are applied.
+'''
+
+import functools
+import os
+import time
+
+import numpy as np
+
+# Thread pools of NumPy's BLAS / OpenMP, read when a process imports them
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def available_cores() -> list[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_resources(n_workers: int, learner_cores: int | None = None, cores: list[int] | None = None) -> dict:
+    '''
+    Split cores between the learner and n_workers env workers.
+    learner_cores: cores of the learner (None: the ones left over by one core per worker, at least 1).
+    With fewer cores than processes, workers share cores round-robin; with a single core everything shares it.
+    Returns {"learner": [cores], "workers": [[cores] per worker]}.
+    '''
+    cores = cores if cores is not None else available_cores()
+    if len(cores) == 1:
+        return {"learner": list(cores), "workers": [list(cores)] * n_workers}
+    if learner_cores is None:
+        learner_cores = max(1, len(cores) - n_workers)
+    learner_cores = min(learner_cores, len(cores) - 1)
+    learner, rest = cores[:learner_cores], cores[learner_cores:]
+    if n_workers <= len(rest):
+        # Spread the spare cores over the workers
+        workers = [list(part) for part in np.array_split(rest, n_workers)]
+    else:
+        workers = [[rest[i % len(rest)]] for i in range(n_workers)]
+    return {"learner": learner, "workers": [[int(core) for core in part] for part in workers]}
+
+
+def limit_blas_threads(threads: int) -> None:
+    '''
+    BLAS / OpenMP thread budget of the processes started from now on.
+    Call before creating the VecEnv: the forkserver imports NumPy with the environment it starts with.
+    '''
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+
+def pin_process(cores: list[int], threads: int | None = None) -> None:
+    '''
+    Pin the current process to cores, with one torch thread per core (or `threads`).
+    '''
+    import torch as th
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    th.set_num_threads(threads or len(cores))
+
+
+def _pinned_env(env_fn, cores: list[int]):
+    pin_process(cores)
+    return env_fn()
+
+
+def pinned_env_fns(env_fns: list, plan: dict) -> list:
+    '''
+    Env constructors pinning their worker process to its planned cores before building the env.
+    '''
+    return [functools.partial(_pinned_env, env_fn, cores) for env_fn, cores in zip(env_fns, plan["workers"])]
+
+
+def amdahl_speedup(parallel_fraction: float, threads: int) -> float:
+    return 1 / ((1 - parallel_fraction) + parallel_fraction / threads)
+
+
+def time_env_step(env_fn, n_steps: int = 200) -> float:
+    '''
+    Seconds per RacetrackEnv step (resets included) with random actions, in this process.
+    '''
+    env = env_fn()
+    env.reset(seed=0)
+    env.action_space.seed(0)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if terminated or truncated:
+            env.reset()
+    elapsed = time.perf_counter() - start
+    env.close()
+    return elapsed / n_steps
+
+
+def time_update(algo: str, env_fn, threads: int, device: str = "cpu", n_transitions: int = 256) -> float:
+    '''
+    Learner seconds per gradient step (off-policy) or per collected transition (on-policy), with `threads` torch threads.
+    '''
+    import torch as th
+    from stable_baselines3.common.off_policy_algorithm import OffPolicyAlgorithm
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from train_model import HYPERPARAMETERS, make_model
+
+    previous_threads = th.get_num_threads()
+    th.set_num_threads(threads)
+    env = DummyVecEnv([env_fn])
+    overrides = {"n_steps": n_transitions} if "n_steps" in HYPERPARAMETERS[algo] else {
+        "buffer_size": n_transitions, "learning_starts": n_transitions,
+    }
+    model = make_model(algo, env, None, device, seed=0, verbose=0, **overrides)
+    try:
+        if isinstance(model, OffPolicyAlgorithm):
+            model.learn(n_transitions)          # Fill the buffer (random actions before learning_starts)
+            model.train(gradient_steps=5, batch_size=model.batch_size)      # Warm up
+            start = time.perf_counter()
+            model.train(gradient_steps=50, batch_size=model.batch_size)
+            return (time.perf_counter() - start) / 50
+        _, callback = model._setup_learn(n_transitions, None)
+        model.collect_rollouts(env, callback, model.rollout_buffer, n_rollout_steps=model.n_steps)
+        start = time.perf_counter()
+        model.train()
+        return (time.perf_counter() - start) / n_transitions
+    finally:
+        env.close()
+        th.set_num_threads(previous_threads)
+
+
+def calibrate_n_envs(algo: str, env_fn, device: str = "cpu", overlapped: bool = False, utd_ratio: float | None = None,
+                     cores: list[int] | None = None, verbose: bool = True) -> tuple[int, dict]:
+    '''
+    Number of env workers maximizing the predicted training throughput (transitions / s) and its resource plan.
+
+    Each worker steps its env on its own core(s) and the learner gets the others, over which it scales as measured
+    between one thread and all of them (Amdahl's law). overlapped: collection and updates run concurrently (AsyncOffPolicyLearner)
+    rather than in turn. utd_ratio: off-policy gradient steps per transition (None: gradient_steps per step of all envs).
+    '''
+    from train_model import HYPERPARAMETERS
+
+    cores = cores if cores is not None else available_cores()
+    step_cost = time_env_step(env_fn)
+    update_cost = time_update(algo, env_fn, 1, device)
+    parallel_fraction = 0.0
+    if len(cores) > 1:
+        speedup = update_cost / time_update(algo, env_fn, len(cores), device)
+        parallel_fraction = float(np.clip((1 - 1 / speedup) / (1 - 1 / len(cores)), 0, 1))
+
+    off_policy = "n_steps" not in HYPERPARAMETERS[algo]
+    best = None
+    for n_workers in range(1, max(2, len(cores))):
+        learner_cores = max(1, len(cores) - n_workers)
+        collect_time = step_cost / n_workers
+        if off_policy:
+            ratio = utd_ratio if utd_ratio is not None else HYPERPARAMETERS[algo].get("gradient_steps", 1) / n_workers
+            learn_time = update_cost * ratio / amdahl_speedup(parallel_fraction, learner_cores)
+        else:
+            learn_time = update_cost / amdahl_speedup(parallel_fraction, learner_cores)
+        throughput = 1 / (max(collect_time, learn_time) if overlapped else collect_time + learn_time)
+        if best is None or throughput > best[1]:
+            best = (n_workers, throughput)
+
+    n_envs, throughput = best
+    if verbose:
+        print(f"Calibration on {len(cores)} cores: {step_cost * 1e3:.2f} ms per env step, "
+              f"{update_cost * 1e3:.2f} ms per {'gradient step' if off_policy else 'transition'} update on 1 thread "
+              f"(parallel fraction {parallel_fraction:.2f})")
+        print(f"-> {n_envs} envs, ~{throughput:.0f} transitions/s predicted")
+    return n_envs, plan_resources(n_envs, cores=cores)
@@ -11,9 +11,12 @@ https://github.com/eleurent/highway-env
 import numpy as np
 from highway_env.road.lane import CircularLane, LineType, StraightLane
 from highway_env.road.road import Road, RoadNetwork
+from trajectory_history import TrajectoryRoad
+from track_profile import track_profile
+from lane_table import lane_table
 
 
-def make_road_large(np_random, show_trajectories=False) -> Road:
+def make_road_large(np_random, show_trajectories=False, trajectory_length=60, trajectory_stride=3) -> Road:
     net = RoadNetwork()
     w = 5
     w2 = 2 * w
@@ -441,9 +444,15 @@ def make_road_large(np_random, show_trajectories=False) -> Road:
         ),
     )
 
-    road = Road(
+    # Vehicle trajectories (show_trajectories) are kept in bounded ring buffers
+    road = TrajectoryRoad(
         network=net,
         np_random=np_random,
-        record_history=show_trajectories,
+        trajectory_length=trajectory_length if show_trajectories else 0,
+        trajectory_stride=trajectory_stride,
     )
+    # Lookahead curvature / heading / speed limit profile (precomputed once per process)
+    road.profile = track_profile("large", net)
+    # Interned lane ids and lane graph adjacency arrays (built once per process)
+    road.lanes = lane_table("large", net)
     return road
\ No newline at end of file
@@ -0,0 +1,102 @@
+'''
+Precomputed lookahead profile of a racetrack.
+Every lane id is followed around the loop of road sections (a -> b -> ... -> a) and the curvature,
+heading and speed limit are sampled every `resolution` meters, so a query like
+"next 50 m at 5 m spacing" is a single array gather, across section transitions and lap wrap-around.
+The same section offsets give positions along the lap (frenet), to measure distances along the track
+between vehicles on different sections.
+'''
+
+import numpy as np
+from highway_env import utils
+from highway_env.road.lane import CircularLane
+
+
+FEATURES = ("curvature", "heading", "speed_limit")
+
+
+def lane_curvature(lane) -> float:
+    '''
+    Signed curvature [1/m] of a lane (0 for straight lanes).
+    '''
+    if isinstance(lane, CircularLane):
+        return lane.direction / lane.radius
+    return 0.0
+
+
+class TrackProfile:
+    def __init__(self, network, resolution: float = 1.0):
+        self.resolution = resolution
+        self.profiles = []      # Per lane id: (samples, len(FEATURES)) array over one lap
+        self.offsets = []       # Per lane id: {(from, to): arc-length of the section start in the lap}
+        self.lanes = []         # Per lane id: {(from, to): lane followed on the section}
+        self.lengths = []       # Per lane id: lap length
+
+        start = next(iter(network.graph))
+        lane_ids = max(len(lanes) for to_dict in network.graph.values() for lanes in to_dict.values())
+        for lane_id in range(lane_ids):
+            offsets = {}
+            section_lanes = {}
+            samples = []
+            length = 0.0
+            _from = start
+            while True:
+                _to = next(iter(network.graph[_from]))      # Racetracks have a single successor per section
+                lanes = network.graph[_from][_to]
+                lane = lanes[min(lane_id, len(lanes) - 1)]
+                offsets[(_from, _to)] = length
+                section_lanes[(_from, _to)] = lane
+                # Sample points of the lap falling on this lane
+                first = int(np.ceil(length / resolution))
+                last = int(np.ceil((length + lane.length) / resolution))
+                for i in range(first, last):
+                    s = i * resolution - length
+                    samples.append((lane_curvature(lane), utils.wrap_to_pi(lane.heading_at(s)), lane.speed_limit or 0.0))
+                length += lane.length
+                _from = _to
+                if _from == start:
+                    break
+            self.offsets.append(offsets)
+            self.lanes.append(section_lanes)
+            self.lengths.append(length)
+            self.profiles.append(np.array(samples))
+
+    def lookahead(self, lane_index, longitudinal: float, distances) -> np.ndarray:
+        '''
+        (len(distances), len(FEATURES)) profile at each distance ahead of `longitudinal` on `lane_index`.
+        '''
+        _from, _to, lane_id = lane_index
+        lane_id = min(lane_id, len(self.profiles) - 1)
+        profile = self.profiles[lane_id]
+        s = self.offsets[lane_id][(_from, _to)] + longitudinal + np.asarray(distances)
+        indices = np.floor(s / self.resolution).astype(int) % len(profile)
+        return profile[indices]
+
+    def lap_length(self, lane_id: int) -> float:
+        return self.lengths[min(lane_id, len(self.lengths) - 1)]
+
+    def frenet(self, lane_index, position: np.ndarray) -> tuple[float, float]:
+        '''
+        (arc-length from the start of the lap, lateral offset) of `position`, projected on the lane of the
+        section (from, to) of `lane_index` followed by its lane id.
+        '''
+        _from, _to, lane_id = lane_index
+        lane_id = min(lane_id, len(self.profiles) - 1)
+        longitudinal, lateral = self.lanes[lane_id][(_from, _to)].local_coordinates(position)
+        return self.offsets[lane_id][(_from, _to)] + longitudinal, lateral
+
+    def sample(self, lane_index, longitudinal: float, distance: float = 50, spacing: float = 5) -> np.ndarray:
+        '''
+        Profile every `spacing` meters over the next `distance` meters.
+        '''
+        return self.lookahead(lane_index, longitudinal, np.arange(0, distance + spacing / 2, spacing))
+
+
+# Profiles of the static tracks, built once per process
+profiles = {}
+
+
+def track_profile(track: str, network) -> TrackProfile:
+    if track not in profiles:
+        profiles[track] = TrackProfile(network)
+    return profiles[track]
@@ -1,17 +1,130 @@
 from stable_baselines3 import PPO, A2C, SAC, TD3
 from stable_baselines3.common.vec_env import SubprocVecEnv
+from stable_baselines3.common.callbacks import CallbackList
 from racetrack_env import RacetrackEnv
 import os
-from custom_metrics import CustomMetricsCallback
+import multiprocessing as mp
+from custom_metrics import CustomMetricsCallback, MosaicMonitorCallback, TelemetryCallback
+from multi_agent import MultiAgentVecEnv, multi_agent_config
+from async_vec_env import AsyncVecEnv
+from replay_buffer import PackedReplayBuffer, is_binary_observation
+from worker_pool import PoolVecEnv, DEFAULT_POOL_ADDRESS
+from async_off_policy import AsyncOffPolicyLearner
+from resources import calibrate_n_envs, limit_blas_threads, pin_process, pinned_env_fns, plan_resources
 
 # Set up directories
 current_folder = os.path.dirname(os.path.abspath(__file__))
 logs_folder = os.path.join(current_folder, "logs_v2")
 models_folder = os.path.join(current_folder, "models_v2")
 
+# Step-phase profiler: time one step out of every N in each worker (0 disables it)
+PROFILE_SAMPLE_INTERVAL = 100
+
+# Controlled vehicles per environment (> 1 trains a parameter-shared policy on every agent)
+N_AGENTS = 1
+
+# Extra worker processes absorbing episode resets (0 uses a plain SubprocVecEnv)
+SPARE_WORKERS = 0
+
+# SAC / TD3: bit-packed replay buffer for binary occupancy grid observations (~60x less memory), other observations
+# (RacetrackCompact, grids with speed features) keep SB3's ReplayBuffer
+PACK_REPLAY_BUFFER = True
+REPLAY_BUFFER_SIZE = 1_000_000
+
+# SAC / TD3: collect in a background thread while the learner trains, with UPDATE_TO_DATA_RATIO gradient steps
+# per collected transition (None keeps the ratio of the synchronous loop: gradient_steps per step of all envs).
+# Threaded training is not deterministic, and only faster with cores to spare next to the learner and the env workers
+ASYNC_OFF_POLICY = False
+UPDATE_TO_DATA_RATIO = None
+
+# Build the next episode's road and vehicles in a helper thread of each worker. Worth enabling when resets are a
+# large share of the step time (short episodes, many vehicles) and workers have CPU to spare for the helper thread.
+# Unseeded auto-resets then draw their scenarios from a separate stream, so episodes differ from the default mode
+PREWARM_RESETS = False
+
+# Attach to a running worker pool (python worker_pool.py serve) instead of spawning env processes, e.g. DEFAULT_POOL_ADDRESS
+WORKER_POOL_ADDRESS = None
+
+# Pin env workers and the learner to disjoint cores, with one BLAS / torch thread per worker core (not with a worker pool).
+# Off by default: it changes the thread counts of every process and competes with other jobs pinned on the machine
+PIN_CORES = False
+
+# Live monitor: mosaic of the frames of MONITOR_ENVS env workers every MONITOR_INTERVAL steps, logged to TensorBoard
+# (monitor/mosaic) or written to the video file MONITOR_VIDEO (needs imageio); 0 disables it
+MONITOR_INTERVAL = 0
+MONITOR_ENVS = 4
+MONITOR_VIDEO = None
+
+# Modules imported once by the forkserver, so that env worker processes start with them loaded
+WORKER_PRELOAD = ["racetrack_env", "multi_agent", "async_vec_env", "stable_baselines3.common.vec_env.subproc_vec_env"]
+
+# Config of the training environments
+def env_config():
+    config = {"profile_sample_interval": PROFILE_SAMPLE_INTERVAL, "prewarm_resets": PREWARM_RESETS}
+    if N_AGENTS > 1:
+        config.update(multi_agent_config(N_AGENTS))
+    return config
+
+# Replay buffer class of SAC / TD3 for the configured observation (None: SB3's ReplayBuffer)
+def replay_buffer_class():
+    observation = {**RacetrackEnv.default_config(), **env_config()}["observation"]
+    return PackedReplayBuffer if PACK_REPLAY_BUFFER and is_binary_observation(observation) else None
+
 # Function to create parallel environments
 def create_custom_racetrack_env():
-    return RacetrackEnv()
+    return RacetrackEnv(config=env_config())
+
+# Hyperparameters of each algorithm
+HYPERPARAMETERS = {
+    "PPO": {
+        "learning_rate": 4e-5,   # Smaller learning rate
+        "n_steps": 2048,         # Larger steps per update
+        "gamma": 0.985,          # Slightly lower gamma
+        "gae_lambda": 0.8,       # Adjust GAE lambda
+        "clip_range": 0.2,
+        "vf_coef": 0.4,          # Reduce weight of value loss
+        "normalize_advantage": True,
+    },
+    "A2C": {
+        "learning_rate": 3e-4,
+        "n_steps": 50,
+        "gamma": 0.985,
+        "gae_lambda": 0.95,
+        "max_grad_norm": 0.3,
+    },
+    "SAC": {
+        "learning_rate": 2e-4,
+        "buffer_size": REPLAY_BUFFER_SIZE,
+        "replay_buffer_class": replay_buffer_class(),
+        "gamma": 0.99,
+        "tau": 0.005,
+        "ent_coef": "auto",
+        "target_update_interval": 1,
+    },
+    "TD3": {
+        "learning_rate": 2e-4,
+        "buffer_size": REPLAY_BUFFER_SIZE,
+        "replay_buffer_class": replay_buffer_class(),
+        "gamma": 0.99,
+        "tau": 0.005,
+        "train_freq": 1,
+        "gradient_steps": 1,
+    },
+}
+
+# Model with the hyperparameters of each algorithm (overrides replace some of them)
+def make_model(algo, env, tensorboard_log, device, seed=None, verbose=2, **overrides):
+    if algo not in HYPERPARAMETERS:
+        raise ValueError(f"Invalid algorithm selected: {algo}")
+    return eval(algo)(
+        "MlpPolicy",
+        env,
+        verbose=verbose,
+        tensorboard_log=tensorboard_log,
+        device=device,
+        seed=seed,
+        **{**HYPERPARAMETERS[algo], **overrides},
+    )
 
 if __name__ == "__main__":
     # User input for training configuration
@@ -24,85 +137,68 @@ if __name__ == "__main__":
     run_name = input("Enter run name: ").strip()
     device = input("Enter the device to use (cuda/cpu): ").strip()
     total_timesteps = int(input("Enter total timesteps for training: ").strip())
-    n_envs = int(input("Enter the number of parallel environments: ").strip())
+    n_envs = input("Enter the number of parallel environments (leave blank to calibrate): ").strip()
+    seed = input("Enter the seed (leave blank for a random seed): ").strip()
+    seed = int(seed) if seed else None
 
     # Set up paths
     tensorboard_log = os.path.join(logs_folder, run_name)
     model_save_path = os.path.join(models_folder, run_name)
 
+    async_off_policy = ASYNC_OFF_POLICY and algo in ("SAC", "TD3")
+    if n_envs:
+        n_envs = int(n_envs)
+        plan = plan_resources(n_envs)
+    else:
+        print("Calibrating the number of environments...")
+        n_envs, plan = calibrate_n_envs(
+            algo, create_custom_racetrack_env, device, overlapped=async_off_policy, utd_ratio=UPDATE_TO_DATA_RATIO
+        )
+
     print(f"Setting up {n_envs} parallel environments...")
-    env = SubprocVecEnv([create_custom_racetrack_env for _ in range(n_envs)])
+    mp.set_forkserver_preload(WORKER_PRELOAD)
+    env_fns = [create_custom_racetrack_env for _ in range(n_envs)]
+    pin_cores = PIN_CORES and not WORKER_POOL_ADDRESS       # Pool workers are started by the pool
+    if pin_cores:
+        limit_blas_threads(1)
+        env_fns = pinned_env_fns(env_fns, plan)
+    if WORKER_POOL_ADDRESS:
+        env = PoolVecEnv(WORKER_POOL_ADDRESS, n_envs, config=env_config())
+    elif SPARE_WORKERS > 0:
+        env = AsyncVecEnv(env_fns, n_workers=n_envs + SPARE_WORKERS)
+    else:
+        env = SubprocVecEnv(env_fns)
+    if N_AGENTS > 1:
+        env = MultiAgentVecEnv(env, n_agents=N_AGENTS)
+    if pin_cores:
+        pin_process(plan["learner"])
+        print(f"Learner on cores {plan['learner']}, env workers on cores {sorted(set(sum(plan['workers'], [])))}")
 
     model = None
     if checkpoint_name:
         checkpoint_path = os.path.join(models_folder, checkpoint_name)
         try:
             model = eval(algo).load(checkpoint_path, env=env, device=device)
+            if seed is not None:
+                model.set_random_seed(seed)
             print(f"Checkpoint '{checkpoint_name}' loaded successfully. Continuing training...")
         except FileNotFoundError:
             print(f"Checkpoint '{checkpoint_name}' not found. Starting fresh...")
 
     if not model:
-        if algo == "PPO":
-            model = PPO(
-                "MlpPolicy",
-                env,
-                verbose=2,
-                tensorboard_log=tensorboard_log,
-                learning_rate=4e-5,   # Smaller learning rate
-                n_steps=2048,         # Larger steps per update
-                gamma=0.985,          # Slightly lower gamma
-                gae_lambda=0.8,       # Adjust GAE lambda
-                clip_range=0.2,
-                vf_coef=0.4,          # Reduce weight of value loss
-                normalize_advantage=True,
-                device=device,
-            )
-        elif algo == "A2C":
-            model = A2C(
-                "MlpPolicy",
-                env,
-                verbose=2,
-                tensorboard_log=tensorboard_log,
-                learning_rate=3e-4,
-                n_steps=50,
-                gamma=0.985,
-                gae_lambda=0.95,
-                max_grad_norm=0.3,
-                device=device,
-            )
-        elif algo == "SAC":
-            model = SAC(
-                "MlpPolicy",
-                env,
-                verbose=2,
-                tensorboard_log=tensorboard_log,
-                learning_rate=2e-4,
-                gamma=0.99,
-                tau=0.005,
-                ent_coef="auto",
-                target_update_interval=1,
-                device=device,
-            )
-        elif algo == "TD3":
-            model = TD3(
-                "MlpPolicy",
-                env,
-                verbose=2,
-                tensorboard_log=tensorboard_log,
-                learning_rate=2e-4,
-                gamma=0.99,
-                tau=0.005,
-                train_freq=1,
-                normalize_advantage=True,
-                gradient_steps=1,
-                device=device,
-            )
+        model = make_model(algo, env, tensorboard_log, device, seed)
 
     # Training
     print(f"Training {algo} for {total_timesteps} timesteps...")
-    custom_callback = CustomMetricsCallback(verbose=1)
-    model.learn(total_timesteps=total_timesteps, tb_log_name=run_name, callback=custom_callback)
+    callbacks = [CustomMetricsCallback(verbose=1), TelemetryCallback()]
+    if MONITOR_INTERVAL:
+        callbacks.append(MosaicMonitorCallback(interval=MONITOR_INTERVAL, n_envs=MONITOR_ENVS, video_path=MONITOR_VIDEO))
+    custom_callback = CallbackList(callbacks)
+    if async_off_policy:
+        learner = AsyncOffPolicyLearner(model, utd_ratio=UPDATE_TO_DATA_RATIO)
+        learner.learn(total_timesteps=total_timesteps, tb_log_name=run_name, callback=custom_callback)
+    else:
+        model.learn(total_timesteps=total_timesteps, tb_log_name=run_name, callback=custom_callback)
 
     # Save the trained model
     model.save(model_save_path)
@@ -0,0 +1,144 @@
+'''
+Bounded trajectory history for show_trajectories.
+
+highway-env's record_history appends a full vehicle copy (built with a closest-lane search) to every vehicle's
+history at every simulation frame, and draws each of them as a transparent vehicle sprite. TrajectoryRoad instead
+samples the position and heading of its vehicles every `trajectory_stride` frames into fixed-capacity NumPy ring
+buffers of `trajectory_length` samples, and TrajectoryViewer draws each history as one polyline from contiguous
+arrays. Memory per vehicle is constant whatever the episode length, and recording does not touch the simulation,
+so episodes are the same with or without trajectories.
+'''
+
+import numpy as np
+import pygame
+from highway_env.envs.common.graphics import EnvViewer, ObservationGraphics
+from highway_env.road.graphics import RoadGraphics
+from highway_env.road.road import Road
+from highway_env.vehicle.graphics import VehicleGraphics
+
+
+class TrajectoryHistory:
+    '''
+    Ring buffer of the last `length` sampled (position, heading) of a vehicle, one sample every `stride` frames.
+    '''
+
+    def __init__(self, length: int, stride: int = 1):
+        self.length = length
+        self.stride = stride
+        self.frames = 0             # Frames recorded since the vehicle was added
+        self.count = 0              # Samples written (the next one goes to count % length)
+        self.positions = np.empty((length, 2))
+        self.headings = np.empty(length)
+        # Buffers of arrays(), in chronological order
+        self._positions = np.empty((length, 2))
+        self._headings = np.empty(length)
+
+    def __len__(self) -> int:
+        return min(self.count, self.length)
+
+    def record(self, position: np.ndarray, heading: float) -> None:
+        if self.frames % self.stride == 0:
+            i = self.count % self.length
+            self.positions[i] = position
+            self.headings[i] = heading
+            self.count += 1
+        self.frames += 1
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Contiguous (positions (n, 2), headings (n,)) of the samples, oldest first.
+        The arrays are buffers reused by the next call.
+        '''
+        if self.count <= self.length:
+            return self.positions[:self.count], self.headings[:self.count]
+        start = self.count % self.length
+        tail = self.length - start
+        self._positions[:tail] = self.positions[start:]
+        self._positions[tail:] = self.positions[:start]
+        self._headings[:tail] = self.headings[start:]
+        self._headings[tail:] = self.headings[:start]
+        return self._positions, self._headings
+
+
+class TrajectoryRoad(Road):
+    '''
+    Road recording the trajectory of its vehicles in TrajectoryHistory buffers (trajectory_length 0 records nothing).
+    '''
+
+    def __init__(self, network=None, vehicles=None, road_objects=None, np_random=None,
+                 trajectory_length: int = 0, trajectory_stride: int = 1):
+        super().__init__(network, vehicles, road_objects, np_random, record_history=False)
+        self.trajectory_length = trajectory_length
+        self.trajectory_stride = trajectory_stride
+        self.trajectories = {}      # Vehicle -> TrajectoryHistory
+
+    def step(self, dt: float) -> None:
+        super().step(dt)
+        self.record_trajectories()
+
+    def record_trajectories(self) -> None:
+        if not self.trajectory_length:
+            return
+        trajectories = self.trajectories
+        for vehicle in self.vehicles:
+            history = trajectories.get(vehicle)
+            if history is None:
+                history = trajectories[vehicle] = TrajectoryHistory(self.trajectory_length, self.trajectory_stride)
+            history.record(vehicle.position, vehicle.heading)
+
+
+def display_trajectories(road: TrajectoryRoad, surface) -> None:
+    '''
+    Draw the recorded trajectory of each vehicle of the road as a polyline in the vehicle's color.
+    '''
+    origin, scaling = np.asarray(surface.origin), surface.scaling
+    width = max(1, surface.pix(0.5))
+    for vehicle in road.vehicles:
+        history = road.trajectories.get(vehicle)
+        if history is None or len(history) < 2:
+            continue
+        positions, _ = history.arrays()
+        pixels = ((positions - origin) * scaling).astype(int)
+        pygame.draw.lines(surface, VehicleGraphics.get_color(vehicle), False, pixels.tolist(), width)
+
+
+class TrajectoryViewer(EnvViewer):
+    '''
+    EnvViewer drawing the trajectories of a TrajectoryRoad between the lanes and the vehicles.
+    '''
+
+    def display(self) -> None:
+        road = self.env.road
+        if not self.enabled or not getattr(road, "trajectory_length", 0):
+            return super().display()
+
+        # Same sequence as EnvViewer.display, with the trajectories after the lanes
+        self.sim_surface.move_display_window_to(self.window_position())
+        RoadGraphics.display(road, self.sim_surface)
+        display_trajectories(road, self.sim_surface)
+        if self.vehicle_trajectory:
+            VehicleGraphics.display_trajectory(self.vehicle_trajectory, self.sim_surface, offscreen=self.offscreen)
+        RoadGraphics.display_road_objects(road, self.sim_surface, offscreen=self.offscreen)
+
+        if EnvViewer.agent_display:
+            EnvViewer.agent_display(self.agent_surface, self.sim_surface)
+            if not self.offscreen:
+                if self.config["screen_width"] > self.config["screen_height"]:
+                    self.screen.blit(self.agent_surface, (0, self.config["screen_height"]))
+                else:
+                    self.screen.blit(self.agent_surface, (self.config["screen_width"], 0))
+
+        RoadGraphics.display_traffic(
+            road, self.sim_surface, simulation_frequency=self.env.config["simulation_frequency"], offscreen=self.offscreen
+        )
+        ObservationGraphics.display(self.env.observation_type, self.sim_surface)
+
+        if not self.offscreen:
+            self.screen.blit(self.sim_surface, (0, 0))
+            if self.env.config["real_time_rendering"]:
+                self.clock.tick(self.env.config["simulation_frequency"])
+            pygame.display.flip()
+
+        if self.SAVE_IMAGES and self.directory:
+            pygame.image.save(self.sim_surface, str(self.directory / f"highway-env_{self.frame}.png"))
+            self.frame += 1
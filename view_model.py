@@ -1,7 +1,9 @@
-from stable_baselines3 import PPO, A2C, SAC, TD3
 import os
 import numpy as np
 from racetrack_env import RacetrackEnv
+from replay import EpisodeChecksum
+from policy_export import NumpyPolicy, export_policy, exported_path, is_current
+from evaluation_cache import METRICS, evaluate, summary
 from gymnasium.envs.registration import EnvSpec
 import matplotlib.pyplot as plt
 
@@ -17,8 +19,8 @@ def list_models():
     return models
 
 # Function to create a custom Racetrack environment
-def create_custom_racetrack_env():
-    return RacetrackEnv(render_mode="rgb_array")
+def create_custom_racetrack_env(show_trajectories=False):
+    return RacetrackEnv(render_mode="rgb_array", config={"show_trajectories": show_trajectories})
 
 if __name__ == "__main__":
     # List models and prompt for selection
@@ -43,26 +45,46 @@ if __name__ == "__main__":
     model_path = os.path.join(models_folder, selected_model)
 
     # Prompt for algorithm type
-    algos = {"PPO": PPO, "A2C": A2C, "SAC": SAC, "TD3": TD3}
+    algos = ["PPO", "A2C", "SAC", "TD3"]
     algo = input("Enter the algorithm type (PPO, A2C, SAC, TD3): ").strip().upper()
     if algo not in algos:
         print(f"Algorithm type '{algo}' not recognized.")
         exit()
 
-    # Prompt for device
-    device = input("Enter the device to use (cuda/cpu): ").strip().lower()
-    if device not in ["cuda", "cpu"]:
-        print(f"Device '{device}' not recognized. Please enter 'cuda' or 'cpu'.")
+    # Prompt for runtime: the SB3 model (torch) or its exported actor (NumPy, CPU)
+    runtime = input("Enter the runtime (torch/numpy): ").strip().lower()
+    if runtime not in ["torch", "numpy"]:
+        print(f"Runtime '{runtime}' not recognized. Please enter 'torch' or 'numpy'.")
         exit()
 
+    # Prompt for device
+    device = "cpu"
+    if runtime == "torch":
+        device = input("Enter the device to use (cuda/cpu): ").strip().lower()
+        if device not in ["cuda", "cpu"]:
+            print(f"Device '{device}' not recognized. Please enter 'cuda' or 'cpu'.")
+            exit()
+
+    # Draw the recent trajectory of every vehicle (bounded history, see trajectory_history.py)
+    show_trajectories = input("Show vehicle trajectories? (y/n): ").strip().lower() == "y"
+
     # Set up environment
-    env = create_custom_racetrack_env()
+    env = create_custom_racetrack_env(show_trajectories)
     env.spec = EnvSpec(id="RacetrackEnv-v0")  # Mock spec for compatibility
 
-    # Load the model
+    # Load the model (exporting its actor with the NumPy runtime, again if the model file changed since)
     try:
-        model = algos[algo].load(model_path, env=env, device=device)
-        print(f"Model '{selected_model}' loaded successfully on {device}.")
+        policy_path = exported_path(selected_model)
+        if runtime == "numpy" and is_current(policy_path, model_path):
+            model = NumpyPolicy(policy_path)
+        else:
+            from stable_baselines3 import PPO, A2C, SAC, TD3
+            model = {"PPO": PPO, "A2C": A2C, "SAC": SAC, "TD3": TD3}[algo].load(model_path, env=env, device=device)
+            if runtime == "numpy":
+                export_policy(model, policy_path, model_path)
+                print(f"Policy exported to {policy_path}")
+                model = NumpyPolicy(policy_path)
+        print(f"Model '{selected_model}' loaded successfully on {device} ({runtime}).")
     except Exception as e:
         print(f"Error loading model: {e}")
         exit()
@@ -74,10 +96,25 @@ if __name__ == "__main__":
         print("Invalid input. Please enter an integer.")
         exit()
     
+    # Seeded episodes replay bit-exactly (episode i uses seed + i)
+    seed = input("Enter the seed (leave blank for random episodes): ").strip()
+    seed = int(seed) if seed else None
+
+    # Seeded episodes can be evaluated without rendering, reusing the cached results of previous evaluations
+    if seed is not None and input("Render the episodes? (y/n): ").strip().lower() == "n":
+        results = evaluate(model, model_path, list(range(seed, seed + n_episodes)), runtime=runtime)
+        for i, episode_seed in enumerate(results["seed"]):
+            print(f"Episode {i + 1} (seed {episode_seed}): " + ", ".join(f"{metric} = {results[metric][i]:.3f}" for metric in METRICS))
+        print(f"\nAverage across {n_episodes} episodes: {summary(results)}")
+        env.close()
+        exit()
+
     episode_rewards = []
 
     for episode in range(n_episodes):
-        obs, _ = env.reset()
+        obs, _ = env.reset(seed=seed + episode if seed is not None else None)
+        checksum = EpisodeChecksum()
+        checksum.update(obs)
         total_reward = 0
         done = False
         step=0
@@ -92,6 +129,7 @@ if __name__ == "__main__":
             action, _ = model.predict(obs, deterministic=True)
             obs, reward, terminated, truncated, info = env.step(action)
             done = terminated or truncated
+            checksum.update(obs, reward, terminated, truncated)
             total_reward += reward
             step+=1
             #print("STEP", step, "(reward",reward,"):",info.get("rewards"))
@@ -103,7 +141,7 @@ if __name__ == "__main__":
             env.render()  # Visualize the environment
 
         episode_rewards.append(total_reward)
-        print(f"Episode {episode + 1}: Total Reward = {total_reward}")
+        print(f"Episode {episode + 1}: Total Reward = {total_reward}, Checksum = {checksum.hexdigest()}")
 
     # Print average statistics
     print(f"\nAverage reward across {n_episodes} episodes: {np.mean(episode_rewards)}")
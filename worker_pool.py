@@ -0,0 +1,208 @@
+'''
+Persistent pool of environment workers shared by training and evaluation jobs.
+
+`python worker_pool.py serve --workers 8` starts a daemon whose worker processes have highway-env,
+stable-baselines3 and torch imported and both tracks (and their profiles / observation caches) built once.
+Jobs attach with PoolVecEnv, a SubprocVecEnv whose workers are leased from the daemon instead of spawned,
+and give them back when closed. Each worker keeps its env between jobs and only rebuilds it when a job
+asks for a different config.
+
+The transport is the one of distributed.py (tcp://host:port or unix:///path). Worker i listens on
+<path>.<i> (Unix sockets) or port + 1 + i (TCP). Workers run what jobs send them, so a TCP pool (loopback
+included) and its jobs need the same RACETRACK_AUTHKEY; only the default Unix socket works without it.
+'''
+
+import argparse
+import os
+import threading
+import traceback
+from multiprocessing import Process
+
+from stable_baselines3.common.vec_env import SubprocVecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from distributed import address_authkey, connect, listen, parse_address
+from env_worker import serve_env
+
+DEFAULT_POOL_ADDRESS = "unix:///tmp/racetrack_pool.sock"
+
+
+def worker_address(address: str, index: int) -> str:
+    if address.startswith("tcp://"):
+        (host, port), _ = parse_address(address)
+        return f"tcp://{host}:{port + 1 + index}"
+    return f"{address}.{index}"
+
+
+def make_env(config: dict | None, render_mode: str | None):
+    from racetrack_env import RacetrackEnv
+    from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+    return _patch_env(RacetrackEnv(config=config, render_mode=render_mode))
+
+
+def run_worker(address: str) -> None:
+    '''
+    Pool worker: serves one job at a time on its own address.
+    '''
+    # Warm up: imports, both tracks and their profiles
+    for track in ("small", "large"):
+        make_env({"different_scenarios": False, "track": track}, None).close()
+    env_key = (None, None)
+    env = make_env(None, None)
+
+    listener = listen(address)
+    while True:
+        remote = listener.accept()
+        try:
+            _, key = remote.recv()      # ("configure", (config, render_mode))
+            if key != env_key:
+                env.close()
+                env, env_key = make_env(*key), key
+            serve_env(remote, env)
+        except Exception:
+            traceback.print_exc()       # A failing job must not take the worker down
+        finally:
+            remote.close()
+
+
+class WorkerPool:
+    '''
+    Daemon leasing worker addresses to jobs. A job's workers are given back when it sends "release"
+    or its connection drops.
+    '''
+
+    def __init__(self, address: str, n_workers: int):
+        address_authkey(address)        # Fail before starting the workers without a key for a TCP address
+        self.address = address
+        self.processes = [
+            Process(target=run_worker, args=(worker_address(address, i),), daemon=True) for i in range(n_workers)
+        ]
+        for process in self.processes:
+            process.start()
+        self.free = [worker_address(address, i) for i in range(n_workers)]
+        self.lock = threading.Lock()
+
+    def handle(self, conn) -> None:
+        leased = []
+        try:
+            while True:
+                cmd, data = conn.recv()
+                if cmd == "lease":
+                    with self.lock:
+                        if data <= 0 or data > len(self.free):
+                            conn.send(("error", f"{data} workers requested, {len(self.free)} free"))
+                            continue
+                        workers = self.free[:data]
+                        del self.free[:data]
+                        leased += workers
+                    conn.send(("workers", workers))
+                elif cmd == "release":
+                    break
+                elif cmd == "status":
+                    conn.send(("status", {"workers": len(self.processes), "free": len(self.free)}))
+        except EOFError:
+            pass
+        finally:
+            with self.lock:
+                self.free += leased
+            conn.close()
+
+    def serve(self) -> None:
+        listener = listen(self.address)
+        print(f"Worker pool of {len(self.processes)} workers listening on {self.address}")
+        try:
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+
+class PoolVecEnv(SubprocVecEnv):
+    '''
+    SubprocVecEnv running on workers leased from a WorkerPool.
+
+    :param address: address of the pool
+    :param n_envs: number of workers to lease
+    :param config: RacetrackEnv config of the workers' envs (None for the defaults)
+    :param render_mode: render mode of the workers' envs
+    '''
+
+    def __init__(self, address: str, n_envs: int, config: dict | None = None, render_mode: str | None = None):
+        self.waiting = False
+        self.closed = False
+        self.pool = connect(address)
+        self.pool.send(("lease", n_envs))
+        cmd, workers = self.pool.recv()
+        if cmd == "error":
+            self.pool.close()
+            raise RuntimeError(f"Worker pool at {address}: {workers}")
+
+        self.remotes = [connect(worker) for worker in workers]
+        self.processes = []
+        for remote in self.remotes:
+            remote.send(("configure", (config, render_mode)))
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+            remote.close()
+        self.pool.send(("release", None))
+        self.pool.close()
+        self.closed = True
+
+
+def evaluate(address: str, algo: str, model_name: str, n_envs: int, n_episodes: int, device: str) -> None:
+    from stable_baselines3 import A2C, PPO, SAC, TD3
+    from stable_baselines3.common.evaluation import evaluate_policy
+    from train_model import models_folder
+
+    algos = {"PPO": PPO, "A2C": A2C, "SAC": SAC, "TD3": TD3}
+    env = PoolVecEnv(address, n_envs)
+    try:
+        model = algos[algo].load(os.path.join(models_folder, model_name), env=env, device=device)
+        rewards, lengths = evaluate_policy(model, env, n_eval_episodes=n_episodes, return_episode_rewards=True, warn=False)
+    finally:
+        env.close()
+    print(f"{model_name}: mean reward {sum(rewards) / len(rewards):.2f} over {n_episodes} episodes "
+          f"(mean length {sum(lengths) / len(lengths):.1f} steps)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Persistent environment worker pool")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="start the pool daemon")
+    serve_parser.add_argument("--address", default=DEFAULT_POOL_ADDRESS, help="tcp://host:port or unix:///path")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count())
+
+    status_parser = subparsers.add_parser("status", help="print the free workers of a running pool")
+    status_parser.add_argument("--address", default=DEFAULT_POOL_ADDRESS)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="evaluate a saved model on the pool")
+    evaluate_parser.add_argument("--address", default=DEFAULT_POOL_ADDRESS)
+    evaluate_parser.add_argument("--algo", choices=["PPO", "A2C", "SAC", "TD3"], required=True)
+    evaluate_parser.add_argument("--model", required=True, help="model name in models_v2/")
+    evaluate_parser.add_argument("--envs", type=int, default=4)
+    evaluate_parser.add_argument("--episodes", type=int, default=20)
+    evaluate_parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        WorkerPool(args.address, args.workers).serve()
+    elif args.command == "status":
+        conn = connect(args.address, timeout=0)
+        conn.send(("status", None))
+        print(conn.recv()[1])
+        conn.close()
+    else:
+        evaluate(args.address, args.algo, args.model, args.envs, args.episodes, args.device)